@@ -0,0 +1,80 @@
+"""
+Benchmark de la compresión de respuestas.
+
+Para cada ruta de listado y cada codificación disponible (identity, gzip y, si están instalados
+brotli y zstandard, br y zstd) mide con el test client:
+  - bytes enviados y ratio frente a la respuesta sin comprimir
+  - latencia en el servidor con el cuerpo comprimido ya en caché (hot) y comprimiendo en cada
+    petición (cold, vaciando la caché de cuerpos comprimidos antes de cada una)
+  - transfer_ms: lo que tardarían esos bytes con un enlace de --bandwidth-mbps (un móvil lento
+    por defecto), y total_ms = p50 hot + transfer_ms
+
+    python benchmarks/bench_compression.py --output compression.json
+    python benchmarks/bench_compression.py --bandwidth-mbps 10 --requests 100
+"""
+import argparse
+from harness import load_app, seed, add_volume_args, volumes, summarize, write_results, Timer
+
+ROUTES = [
+    ('planets', '/planets?limit=100'),
+    ('planets_1000', '/planets?limit=1000'),
+    ('starships', '/starships?limit=100'),
+    ('characters', '/characters?limit=100'),
+    ('users', '/users'),
+    ('planets_stream', '/planets?stream=1'),
+]
+
+
+def run(client, path, coding, requests, before=None):
+    headers = {'Accept-Encoding': coding}
+    latencies = []
+    size = 0
+    with Timer() as total:
+        for _ in range(requests):
+            if before:
+                before()
+            with Timer() as timer:
+                response = client.get(path, headers=headers)
+                size = len(response.get_data())
+            latencies.append(timer.elapsed)
+    summary = summarize(latencies, 0, total.elapsed)
+    summary['bytes'] = size
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_args(parser)
+    parser.add_argument('--requests', type=int, default=50, help='peticiones por ruta y codificación')
+    parser.add_argument('--bandwidth-mbps', type=float, default=1.5, help='ancho de banda simulado del cliente')
+    parser.add_argument('--output', default='-', help='fichero JSON de resultados, - para stdout')
+    args = parser.parse_args()
+
+    app, db = load_app(args.database_url)
+    import compression
+    seed(app, db, seed=args.seed, **volumes(args))
+    client = app.test_client()
+
+    results = []
+    for name, path in ROUTES:
+        requests = max(args.requests // 10, 1) if 'stream' in path else args.requests
+        plain = None
+        for coding in ['identity'] + list(compression.coders):
+            run(client, path, coding, 1)
+            hot = run(client, path, coding, requests)
+            plain = plain or hot['bytes']
+            transfer_ms = round(hot['bytes'] * 8 / (args.bandwidth_mbps * 1000), 1)
+            results.append(dict(hot, route=name, method='GET', mode=coding, ratio=round(hot['bytes'] / plain, 3),
+                                transfer_ms=transfer_ms, total_ms=round(hot['p50_ms'] + transfer_ms, 1)))
+            if coding != 'identity' and 'stream' not in path:
+                cold = run(client, path, coding, requests, compression.compressed_cache.clear)
+                results.append(dict(cold, route=name, method='GET', mode=f'{coding}-cold'))
+
+    config = dict(volumes(args), database=app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                  requests=args.requests, bandwidth_mbps=args.bandwidth_mbps, min_size=compression.MIN_SIZE,
+                  codings=list(compression.coders))
+    write_results(args.output, 'compression', config, results)
+
+
+if __name__ == '__main__':
+    main()
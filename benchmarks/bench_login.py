@@ -0,0 +1,86 @@
+"""
+Benchmark de /login.
+
+  - hash: hashes por segundo en un solo hilo con los parámetros de scrypt actuales
+  - login: throughput de /login contra el servidor WSGI interno con tantos clientes como
+    núcleos, y logins por segundo por núcleo
+  - reads_during_logins: latencia de /planets mientras otra tanda de clientes hace login,
+    para ver que el pool de hash acotado no deja sin CPU a las lecturas
+
+Los parámetros se cambian con las variables de passwords.py (PASSWORD_SCRYPT_N, ...).
+
+    python benchmarks/bench_login.py --requests 200 --output login.json
+    PASSWORD_SCRYPT_N=32768 PASSWORD_HASH_WORKERS=4 python benchmarks/bench_login.py
+"""
+import argparse
+import os
+import random
+import threading
+from harness import load_app, seed, add_volume_args, volumes, summarize, write_results, Timer
+from bench_api import run_http, start_wsgi_server
+
+PASSWORD = 'password'
+
+
+def run_hashes(requests):
+    from passwords import hash_password
+    latencies = []
+    with Timer() as total:
+        for _ in range(requests):
+            with Timer() as timer:
+                hash_password(PASSWORD)
+            latencies.append(timer.elapsed)
+    return summarize(latencies, 0, total.elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_args(parser)
+    parser.add_argument('--requests', type=int, default=200, help='logins por escenario')
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1, help='clientes simultáneos')
+    parser.add_argument('--output', default='-', help='fichero JSON de resultados, - para stdout')
+    args = parser.parse_args()
+
+    app, db = load_app(args.database_url)
+    import passwords
+    from models import User
+    seed(app, db, seed=args.seed, **volumes(args))
+    with app.app_context():
+        # El mismo hash para todos: calcular uno por usuario solo alargaría la siembra
+        db.session.execute(User.__table__.update().values(password=passwords.hash_password(PASSWORD)))
+        db.session.commit()
+
+    users = max(args.users, 1)
+    rng = random.Random(args.seed)
+    cores = os.cpu_count() or 1
+
+    def login(i):
+        return '/login', {'email': f'user{rng.randrange(users)}@bench.local', 'password': PASSWORD}
+
+    results = []
+    summary = run_hashes(max(args.requests // 10, 5))
+    results.append(dict(summary, route='hash', method='-', mode='direct'))
+
+    server, base_url = start_wsgi_server(app)
+    run_http(base_url, 'POST', login, None, args.concurrency, args.concurrency)
+    summary = run_http(base_url, 'POST', login, None, args.requests, args.concurrency)
+    results.append(dict(summary, route='login', method='POST', mode='wsgi',
+                        logins_per_core=round(summary['throughput_rps'] / cores, 1)))
+
+    # Lecturas mientras hay una avalancha de logins de fondo
+    background = threading.Thread(target=run_http, args=(base_url, 'POST', login, None, args.requests * 4, args.concurrency * 4))
+    background.start()
+    summary = run_http(base_url, 'GET', lambda i: ('/planets?limit=10', None), None, args.requests, 2)
+    background.join()
+    results.append(dict(summary, route='reads_during_logins', method='GET', mode='wsgi'))
+    server.shutdown()
+
+    config = dict(volumes(args), database=app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                  requests=args.requests, concurrency=args.concurrency, cores=cores,
+                  scrypt={'n': passwords.SCRYPT_N, 'r': passwords.SCRYPT_R, 'p': passwords.SCRYPT_P},
+                  hash_workers=passwords.HASH_WORKERS, hash_queue=passwords.HASH_QUEUE)
+    write_results(args.output, 'login', config, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark de memoria de los listados del catálogo.
+
+Compara tres formas de tener en memoria --rows planetas:
+  - orm: objetos del ORM (Planets.query.all()), que se serializan con serialize(), el camino original
+  - dicts: tuplas del select() convertidas en un dict por fila, el camino anterior
+  - records: registros con __slots__ de records.py, el camino actual
+
+Para cada una mide:
+  - bytes_per_row: memoria que ocupan las filas mientras se tienen en una lista (tracemalloc,
+    valores incluidos), que es lo que guarda una página de catalog_cache
+  - peak_rss_mb: pico de RSS de un proceso nuevo que construye y serializa una respuesta con
+    todas las filas, y rss_growth_mb lo que crece respecto a tener la app cargada
+Además mide el pico de RSS de la exportación en streaming (/planets?stream=1) completa.
+
+    python benchmarks/bench_memory.py --planets 100000 --output memory.json
+"""
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+import tracemalloc
+from harness import load_app, seed, add_volume_args, volumes, summarize, write_results, Timer
+
+VARIANTS = ('orm', 'dicts', 'records')
+
+
+def peak_rss():
+    # En Linux VmHWM: ru_maxrss se hereda del proceso padre a través de fork y exec
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def loader(app, db, variant, limit):
+    from sqlalchemy import select
+    from models import Planets
+    from catalog import select_columns
+    from records import rows_to_records
+    stmt = select(*select_columns(Planets, None)).order_by(Planets.id).limit(limit)
+
+    if variant == 'orm':
+        return lambda: Planets.query.order_by(Planets.id).limit(limit).all()
+    if variant == 'dicts':
+        def load():
+            rows = db.session.execute(stmt).all()
+            keys = rows[0]._fields if rows else ()
+            return [dict(zip(keys, row)) for row in rows]
+        return load
+    return lambda: rows_to_records(db.session.execute(stmt).all())
+
+
+def measure_rows(app, db, variant, limit, repeat):
+    # Las filas se miden ya sin el resultado de la consulta ni la sesión (como en la caché)
+    latencies = []
+    with app.app_context():
+        load = loader(app, db, variant, limit)
+        for _ in range(repeat):
+            with Timer() as timer:
+                load()
+            latencies.append(timer.elapsed)
+            db.session.remove()
+        gc.collect()
+        tracemalloc.start()
+        rows = load()
+        db.session.remove()
+        gc.collect()
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    summary = summarize(latencies, 0, sum(latencies))
+    summary.pop('throughput_rps', None)
+    return dict(summary, rows=len(rows), bytes_per_row=round(used / max(len(rows), 1), 1))
+
+
+def child(database_url, variant, limit):
+    # Se ejecuta en un proceso nuevo para que el pico de RSS sea solo el de esta variante
+    app, db = load_app(database_url)
+    client = app.test_client()
+    base = peak_rss()
+    with Timer() as timer:
+        if variant == 'stream':
+            size = sum(len(chunk) for chunk in client.get('/planets?stream=1').response)
+        else:
+            with app.app_context():
+                rows = loader(app, db, variant, limit)()
+                if variant == 'orm':
+                    rows = [planet.serialize() for planet in rows]
+                size = len(app.json.dumps({'planets': rows}))
+    print(json.dumps({'base': base, 'peak': peak_rss(), 'seconds': timer.elapsed, 'bytes': size}))
+
+
+def run_child(database_url, variant, limit):
+    process = subprocess.run([sys.executable, __file__, '--child', variant, '--rows', str(limit),
+                              '--database-url', database_url], capture_output=True, text=True, check=True)
+    measure = json.loads(process.stdout.strip().splitlines()[-1])
+    return {
+        'peak_rss_mb': round(measure['peak'] / 2 ** 20, 1),
+        'rss_growth_mb': round((measure['peak'] - measure['base']) / 2 ** 20, 1),
+        'response_bytes': measure['bytes'],
+        'seconds': round(measure['seconds'], 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_args(parser)
+    parser.set_defaults(planets=100000, users=10, favourites=5, characters=100, starships=100)
+    parser.add_argument('--rows', type=int, default=100000, help='filas por respuesta')
+    parser.add_argument('--repeat', type=int, default=3, help='cargas cronometradas por variante')
+    parser.add_argument('--output', default='-', help='fichero JSON de resultados, - para stdout')
+    parser.add_argument('--child', choices=VARIANTS + ('stream',), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.database_url, args.child, args.rows)
+        return
+
+    app, db = load_app(args.database_url)
+    seed(app, db, seed=args.seed, **volumes(args))
+
+    results = []
+    for variant in VARIANTS:
+        summary = measure_rows(app, db, variant, args.rows, args.repeat)
+        summary.update(run_child(args.database_url, variant, args.rows))
+        results.append(dict(summary, route=variant, method='GET', mode='memory'))
+    results.append(dict(run_child(args.database_url, 'stream', args.rows), route='stream', method='GET', mode='memory'))
+
+    config = dict(volumes(args), database=app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0], rows=args.rows)
+    write_results(args.output, 'memory', config, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark de la serialización JSON.
+
+Mide dos cosas con la misma base de datos sembrada:
+  - endpoints: las rutas de lectura con páginas grandes a través del test client, una vez con
+    cada proveedor JSON (stdlib y orjson si está instalado)
+  - rows: solo construir y serializar 1000 filas de cada catálogo, comparando el camino antiguo
+    (objetos del ORM + serialize() + json de la stdlib) con los registros del SELECT (records.py)
+    + cada proveedor
+
+    python benchmarks/bench_serialization.py --output serialization.json
+    python benchmarks/compare.py serialization_old.json serialization_new.json
+"""
+import argparse
+import random
+from harness import load_app, seed, add_volume_args, volumes, summarize, write_results, Timer
+from bench_api import run_testclient, auth_headers
+
+
+def build_scenarios(vol, rng):
+    users = max(vol['users'], 1)
+
+    def with_user(path):
+        user_id = rng.randint(1, users)
+        return path.format(user_id=user_id), None, auth_headers(user_id)
+
+    return [
+        ('planets', lambda i: ('/planets?limit=1000', None)),
+        ('starships', lambda i: ('/starships?limit=1000', None)),
+        ('characters', lambda i: ('/characters?limit=1000', None)),
+        ('planets_stream', lambda i: ('/planets?stream=1', None)),
+        ('favourites', lambda i: with_user('/user/{user_id}/favourites')),
+        ('search', lambda i: ('/search?q=planet&limit=50', None)),
+    ]
+
+
+def run_rows(app, db, model, variant, requests, limit=1000):
+    from sqlalchemy import select
+    from catalog import select_columns
+    from records import rows_to_records
+    latencies = []
+    with app.test_request_context():
+        if variant == 'orm':
+            query = model.query.order_by(model.id).limit(limit)
+            dumps = app.json.dumps
+            encode = lambda: dumps([item.serialize() for item in query.all()])
+        else:
+            stmt = select(*select_columns(model, None)).order_by(model.id).limit(limit)
+            dumps = getattr(app.json, 'dumps_bytes', app.json.dumps)
+            encode = lambda: dumps(rows_to_records(db.session.execute(stmt).all()))
+        with Timer() as total:
+            for _ in range(requests):
+                with Timer() as timer:
+                    encode()
+                latencies.append(timer.elapsed)
+    return summarize(latencies, 0, total.elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_volume_args(parser)
+    parser.add_argument('--requests', type=int, default=200, help='repeticiones por ruta y proveedor')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--output', default='-', help='fichero JSON de resultados, - para stdout')
+    args = parser.parse_args()
+
+    app, db = load_app(args.database_url)
+    from catalog import CATALOG_MODELS
+    from json_provider import PROVIDERS, orjson, init_json
+    seed(app, db, seed=args.seed, **volumes(args))
+    providers = [name for name in PROVIDERS if name != 'orjson' or orjson]
+
+    results = []
+    for provider in providers:
+        init_json(app, provider)
+        rng = random.Random(args.seed)
+        for name, make in build_scenarios(volumes(args), rng):
+            run_testclient(app, 'GET', make, None, args.warmup)
+            summary = run_testclient(app, 'GET', make, None, args.requests)
+            results.append(dict(summary, route=name, method='GET', mode=f'endpoint-{provider}'))
+
+    # Camino antiguo con la stdlib frente a las tuplas con cada proveedor
+    for variant, provider in [('orm', 'stdlib')] + [('rows', provider) for provider in providers]:
+        init_json(app, provider)
+        for name, model in CATALOG_MODELS.items():
+            run_rows(app, db, model, variant, args.warmup)
+            summary = run_rows(app, db, model, variant, args.requests)
+            results.append(dict(summary, route=name, method='-', mode=f'{variant}-{provider}'))
+
+    config = dict(volumes(args), database=app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                  requests=args.requests, providers=providers)
+    write_results(args.output, 'serialization', config, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark del arranque: lo que paga cada worker de gunicorn (y cada flask db upgrade) antes de
+atender la primera petición.
+
+Cada escenario se ejecuta --runs veces en un proceso nuevo con python -X importtime y se mide el
+tiempo de importar app.py, la memoria residente (RSS) al terminar y cuántos módulos hay cargados.
+Del último proceso de cada escenario se guardan los --top módulos que más tardan en importarse
+(tiempo acumulado, con sus dependencias).
+
+  - import: arranque normal, con el admin montado pero sin cargar
+  - import_no_admin: con ENABLE_ADMIN=0
+  - first_admin_request: arranque más la primera petición a /admin/, que carga Flask-Admin
+  - eager_components: arranque más los imports que antes se hacían siempre (Flask-Admin,
+    flask_migrate con Alembic, flask_swagger), como referencia de lo que se ahorra
+
+    python benchmarks/bench_startup.py --runs 10 --output startup.json
+    python benchmarks/compare.py startup_old.json startup_new.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from harness import SRC, DEFAULT_DATABASE_URL, summarize, write_results
+
+CHILD = '''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+{extra}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != 'darwin':
+    rss *= 1024
+print(json.dumps({{'seconds': elapsed, 'rss': rss, 'modules': len(sys.modules)}}))
+'''
+
+SCENARIOS = [
+    ('import', {}, ''),
+    ('import_no_admin', {'ENABLE_ADMIN': '0'}, ''),
+    ('first_admin_request', {}, 'app.app.test_client().get("/admin/")'),
+    ('eager_components', {}, 'import flask_admin.contrib.sqla, flask_migrate, flask_swagger'),
+]
+
+
+def parse_importtime(stderr, top):
+    # Líneas "import time: self [us] | cumulative | módulo", con dos espacios más por nivel.
+    # Solo los dos primeros niveles: app y lo que importa directamente
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if len(name) - len(name.lstrip()) <= 3:
+            modules.append({'module': name.strip(), 'cumulative_ms': round(int(cumulative) / 1000, 2)})
+    return sorted(modules, key=lambda module: -module['cumulative_ms'])[:top]
+
+
+def run_scenario(env, extra, runs, top):
+    code = CHILD.format(extra=extra)
+    latencies, rss, modules = [], [], 0
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=SRC, env=env,
+                                 capture_output=True, text=True, check=True)
+        measure = json.loads(process.stdout.strip().splitlines()[-1])
+        latencies.append(measure['seconds'])
+        rss.append(measure['rss'])
+        modules = measure['modules']
+    summary = summarize(latencies, 0, sum(latencies))
+    summary.pop('throughput_rps', None)
+    rss.sort()
+    return dict(summary, rss_mb=round(rss[len(rss) // 2] / 2 ** 20, 1), modules=modules,
+                top_imports=parse_importtime(process.stderr, top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL),
+                        help='solo se usa para configurar la app, no se siembra')
+    parser.add_argument('--runs', type=int, default=10, help='procesos por escenario')
+    parser.add_argument('--top', type=int, default=15, help='módulos más lentos a guardar por escenario')
+    parser.add_argument('--output', default='-', help='fichero JSON de resultados, - para stdout')
+    args = parser.parse_args()
+
+    base_env = dict(os.environ, DATABASE_URL=args.database_url, RATE_LIMIT_ENABLED='0')
+    base_env.pop('FLASK_RUN_FROM_CLI', None)
+    results = []
+    for name, env, extra in SCENARIOS:
+        summary = run_scenario(dict(base_env, **env), extra, args.runs, args.top)
+        results.append(dict(summary, route=name, method='-', mode='startup'))
+
+    config = {'database': args.database_url.split(':')[0], 'runs': args.runs}
+    write_results(args.output, 'startup', config, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Compara dos ficheros de resultados de los benchmarks (por ejemplo de dos commits).
+
+    python benchmarks/compare.py base.json new.json --threshold 0.2
+
+Sale con código 1 si alguna ruta empeora su p50 o su p99 más que el umbral.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as source:
+        document = json.load(source)
+    return document, {(result.get('mode'), result['route']): result for result in document['results']}
+
+
+def change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.2, help='empeoramiento máximo permitido (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    base_doc, base = load(args.base)
+    new_doc, new = load(args.new)
+    print(f"base {base_doc.get('commit', '?')[:10]}  new {new_doc.get('commit', '?')[:10]}")
+    print(f"{'mode':<11} {'route':<20} {'p50 ms':>18} {'p99 ms':>18} {'req/s':>18}")
+
+    regressions = []
+    for key in sorted(set(base) & set(new), key=lambda key: (str(key[0]), key[1])):
+        old_result, new_result = base[key], new[key]
+        cells = []
+        for metric in ('p50_ms', 'p99_ms', 'throughput_rps'):
+            delta = change(old_result.get(metric), new_result.get(metric))
+            cells.append(f"{old_result.get(metric)!s:>7} → {new_result.get(metric)!s:<7}"
+                         + (f'{delta:+.0%}' if delta is not None else ''))
+            if metric != 'throughput_rps' and delta is not None and delta > args.threshold:
+                regressions.append((key, metric, delta))
+        print(f"{str(key[0]):<11} {key[1]:<20} " + ' '.join(f'{cell:>18}' for cell in cells))
+
+    for (mode, route), metric, delta in regressions:
+        print(f'REGRESIÓN {mode} {route} {metric} {delta:+.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
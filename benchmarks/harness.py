@@ -0,0 +1,162 @@
+"""
+Utilidades comunes de los benchmarks: preparar la app contra una base de datos concreta,
+sembrar datos de prueba con volúmenes configurables, medir latencias y guardar resultados.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/bench.db'
+
+
+def load_app(database_url):
+    # app.py lee DATABASE_URL al importarse, así que hay que fijarla antes
+    os.environ['DATABASE_URL'] = database_url
+    # Los benchmarks lanzan cientos de peticiones por ruta desde el mismo cliente
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    import app as app_module
+    return app_module.app, app_module.db
+
+
+def add_volume_args(parser):
+    parser.add_argument('--database-url', default=os.getenv('BENCH_DATABASE_URL', DEFAULT_DATABASE_URL),
+                        help='SQLite o Postgres local, se vacía antes de sembrar')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--favourites', type=int, default=20, help='favoritos por usuario')
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--planets', type=int, default=1000)
+    parser.add_argument('--starships', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42, help='semilla para que los datos sean reproducibles')
+
+
+def volumes(args):
+    return {name: getattr(args, name) for name in ('users', 'favourites', 'characters', 'planets', 'starships')}
+
+
+def seed(app, db, users=100, favourites=20, characters=1000, planets=1000, starships=1000, seed=42, chunk=5000):
+    # Borra y vuelve a crear todas las tablas y las llena con INSERT masivos
+    from models import User, Favourites, Characters, Planets, Starships
+    rng = random.Random(seed)
+
+    def insert(model, rows):
+        for start in range(0, len(rows), chunk):
+            db.session.execute(model.__table__.insert(), rows[start:start + chunk])
+        db.session.commit()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        insert(Characters, [{
+            'name': f'Character {i}', 'height': rng.randint(50, 250), 'mass': rng.randint(20, 200),
+            'hair_color': rng.choice(['black', 'brown', 'blond', 'none']),
+            'skin_color': rng.choice(['fair', 'gold', 'green', 'dark']),
+            'birth_year': f'{rng.randint(1, 900)}BBY',
+            'gender': rng.choice(['male', 'female', 'others'])
+        } for i in range(characters)])
+        insert(Planets, [{
+            'name': f'Planet {i}', 'diameter': rng.randint(1000, 200000),
+            'rotation_period': rng.randint(10, 50), 'orbital_period': rng.randint(100, 5000),
+            'gravity': rng.choice(['1 standard', '0.5 standard', '2 standard']),
+            'population': rng.randint(0, 10 ** 9),
+            'climate': rng.choice(['arid', 'temperate', 'frozen', 'murky']),
+            'terrain': rng.choice(['desert', 'forest', 'ocean', 'mountains'])
+        } for i in range(planets)])
+        insert(Starships, [{
+            'name': f'Starship {i}', 'model': f'Model {i % 50}',
+            'starship_class': rng.choice(['fighter', 'freighter', 'cruiser', 'transport']),
+            'manufacturer': rng.choice(['Kuat', 'Corellian', 'Sienar', 'Incom']),
+            'cost_in_credits': rng.randint(10 ** 4, 10 ** 8), 'length': rng.randint(5, 2000),
+            'crew': rng.randint(1, 5000), 'passengers': rng.randint(0, 600),
+            'max_atmosphering_speed': rng.randint(500, 1500), 'cargo_capacity': rng.randint(0, 10 ** 6)
+        } for i in range(starships)])
+        insert(User, [{
+            'email': f'user{i}@bench.local', 'password': 'password', 'is_active': True
+        } for i in range(users)])
+
+        # Favoritos sin repetir por usuario, repartidos entre las tres tablas
+        targets = [('character_id', characters), ('planet_id', planets), ('starship_id', starships)]
+        targets = [(column, count) for column, count in targets if count]
+        rows = []
+        for user_id in range(1, users + 1):
+            chosen = set()
+            while targets and len(chosen) < favourites:
+                column, count = rng.choice(targets)
+                chosen.add((column, rng.randint(1, count)))
+            for column, item_id in chosen:
+                row = {'user_id': user_id, 'character_id': None, 'planet_id': None, 'starship_id': None}
+                row[column] = item_id
+                rows.append(row)
+        insert(Favourites, rows)
+
+        # Los INSERT de core no pasan por los eventos que mantienen /stats
+        from stats import rebuild_stats
+        rebuild_stats()
+
+
+def summarize(latencies, errors, elapsed):
+    # Latencias en segundos -> resumen en milisegundos
+    ordered = sorted(latencies)
+    count = len(ordered)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[min(count - 1, int(p / 100 * count))] * 1000, 3)
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(ordered) / count * 1000, 3) if count else None,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, config, results):
+    # Un JSON por ejecución para poder compararlas entre commits con compare.py
+    document = {
+        'benchmark': benchmark,
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'results': results
+    }
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as output:
+            output.write(text + '\n')
+    return document
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
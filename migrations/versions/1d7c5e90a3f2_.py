@@ -0,0 +1,33 @@
+"""user password column holds scrypt hashes
+
+Revision ID: 1d7c5e90a3f2
+Revises: e5b3a8d46f19
+Create Date: 2026-10-18 14:02:17.418266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1d7c5e90a3f2'
+down_revision = 'e5b3a8d46f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las contraseñas en texto plano se quedan como están y se cambian por su hash al iniciar sesión
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=80),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=80),
+               existing_nullable=False)
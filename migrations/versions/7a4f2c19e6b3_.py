@@ -0,0 +1,46 @@
+"""catalog_stats counter table for /stats
+
+Revision ID: 7a4f2c19e6b3
+Revises: 1d7c5e90a3f2
+Create Date: 2026-10-18 14:41:09.552830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4f2c19e6b3'
+down_revision = '1d7c5e90a3f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    catalog_stats = op.create_table('catalog_stats',
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Contadores iniciales con los datos que ya hay (lo mismo que stats.compute_stats)
+    bind = op.get_bind()
+    planets = bind.execute(sa.text('SELECT COUNT(*), COALESCE(SUM(population), 0) FROM planets')).one()
+    starships = bind.execute(sa.text('SELECT COUNT(*), COALESCE(SUM(crew), 0), COUNT(crew) FROM starships')).one()
+    rows = [
+        {'name': 'planets.count', 'value': planets[0]},
+        {'name': 'planets.population_total', 'value': planets[1]},
+        {'name': 'starships.count', 'value': starships[0]},
+        {'name': 'starships.crew_total', 'value': starships[1]},
+        {'name': 'starships.crew_known', 'value': starships[2]}
+    ]
+    characters = 0
+    for gender, count in bind.execute(sa.text('SELECT gender, COUNT(*) FROM characters GROUP BY gender')):
+        rows.append({'name': f'characters.gender.{gender or "unknown"}', 'value': count})
+        characters += count
+    rows.append({'name': 'characters.count', 'value': characters})
+    op.bulk_insert(catalog_stats, [row for row in rows if row['value']])
+
+
+def downgrade():
+    op.drop_table('catalog_stats')
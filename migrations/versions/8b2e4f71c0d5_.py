@@ -0,0 +1,35 @@
+"""trigram indexes for name search (postgres only)
+
+Revision ID: 8b2e4f71c0d5
+Revises: 3f1d6c2a9b47
+Create Date: 2026-10-18 11:03:27.118640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4f71c0d5'
+down_revision = '3f1d6c2a9b47'
+branch_labels = None
+depends_on = None
+
+TABLES = ('characters', 'planets', 'starships')
+
+
+def upgrade():
+    # Solo en Postgres: con SQLite /search usa el índice en memoria de search.py
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        op.create_index(f'ix_{table}_name_trgm', table, ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
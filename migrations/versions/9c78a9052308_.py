@@ -0,0 +1,31 @@
+"""data_versions table for user route ETags
+
+Revision ID: 9c78a9052308
+Revises: b93e0d5a27c4
+Create Date: 2026-10-18 13:12:45.567259
+
+"""
+import secrets
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c78a9052308'
+down_revision = 'b93e0d5a27c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_versions = op.create_table('data_versions',
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Epoch aleatorio, como versions.new_epoch: los ETag de esta base de datos no repiten los de otra
+    op.bulk_insert(data_versions, [{'name': 'epoch', 'value': secrets.randbelow(2 ** 62)}])
+
+
+def downgrade():
+    op.drop_table('data_versions')
@@ -0,0 +1,46 @@
+"""favourite_counts table for the popularity ranking
+
+Revision ID: b93e0d5a27c4
+Revises: 7a4f2c19e6b3
+Create Date: 2026-10-18 15:20:44.107391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b93e0d5a27c4'
+down_revision = '7a4f2c19e6b3'
+branch_labels = None
+depends_on = None
+
+TARGETS = (('characters', 'character_id'), ('planets', 'planet_id'), ('starships', 'starship_id'))
+
+
+def upgrade():
+    favourite_counts = op.create_table('favourite_counts',
+    sa.Column('target_type', sa.String(length=20), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('target_type', 'target_id')
+    )
+    with op.batch_alter_table('favourite_counts', schema=None) as batch_op:
+        batch_op.create_index('ix_favourite_counts_ranking', ['target_type', 'value'], unique=False)
+
+    # Contadores iniciales desde los favoritos que ya hay (lo mismo que popularity.rebuild_counts)
+    bind = op.get_bind()
+    for target_type, column in TARGETS:
+        rows = bind.execute(sa.text(
+            f'SELECT {column}, COUNT(*) FROM favourites WHERE {column} IS NOT NULL GROUP BY {column}'
+        )).all()
+        op.bulk_insert(favourite_counts, [
+            {'target_type': target_type, 'target_id': target_id, 'value': count} for target_id, count in rows
+        ])
+
+
+def downgrade():
+    with op.batch_alter_table('favourite_counts', schema=None) as batch_op:
+        batch_op.drop_index('ix_favourite_counts_ranking')
+
+    op.drop_table('favourite_counts')
@@ -0,0 +1,43 @@
+"""unique favourites per user and target
+
+Revision ID: c47a9e15d2b8
+Revises: 8b2e4f71c0d5
+Create Date: 2026-10-18 12:31:09.742215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a9e15d2b8'
+down_revision = '8b2e4f71c0d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Las restricciones son por (usuario, destino): una fila con varios destinos (creada desde el
+    # admin) podría chocar con otra de un solo destino aunque no sean iguales en las cuatro
+    # columnas. Se queda con el primero (personaje, planeta, nave), como hace e5b3a8d46f19.
+    op.execute('UPDATE favourites SET planet_id = NULL, starship_id = NULL WHERE character_id IS NOT NULL')
+    op.execute('UPDATE favourites SET starship_id = NULL WHERE planet_id IS NOT NULL')
+    # Antes de crear las restricciones quitamos los duplicados que hayan podido entrar,
+    # quedándonos con el favorito más antiguo
+    op.execute(
+        'DELETE FROM favourites WHERE id NOT IN ('
+        'SELECT id FROM (SELECT MIN(id) AS id FROM favourites '
+        'GROUP BY user_id, character_id, planet_id, starship_id) AS keep)'
+    )
+    # batch_alter_table para que también funcione en SQLite
+    with op.batch_alter_table('favourites', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_favourites_user_character', ['user_id', 'character_id'])
+        batch_op.create_unique_constraint('uq_favourites_user_planet', ['user_id', 'planet_id'])
+        batch_op.create_unique_constraint('uq_favourites_user_starship', ['user_id', 'starship_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('favourites', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_favourites_user_starship', type_='unique')
+        batch_op.drop_constraint('uq_favourites_user_planet', type_='unique')
+        batch_op.drop_constraint('uq_favourites_user_character', type_='unique')
@@ -0,0 +1,43 @@
+"""favourites must point to exactly one target
+
+Revision ID: e5b3a8d46f19
+Revises: c47a9e15d2b8
+Create Date: 2026-10-18 13:05:52.337104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b3a8d46f19'
+down_revision = 'c47a9e15d2b8'
+branch_labels = None
+depends_on = None
+
+ONE_TARGET = (
+    '(CASE WHEN character_id IS NULL THEN 0 ELSE 1 END'
+    ' + CASE WHEN planet_id IS NULL THEN 0 ELSE 1 END'
+    ' + CASE WHEN starship_id IS NULL THEN 0 ELSE 1 END) = 1'
+)
+
+
+def upgrade():
+    # Filas que no cumplirían la restricción (solo se podían crear desde el admin):
+    # sin ningún destino se borran, con varios se queda el primero (personaje, planeta, nave)
+    op.execute('DELETE FROM favourites WHERE character_id IS NULL AND planet_id IS NULL AND starship_id IS NULL')
+    op.execute('UPDATE favourites SET planet_id = NULL, starship_id = NULL WHERE character_id IS NOT NULL')
+    op.execute('UPDATE favourites SET starship_id = NULL WHERE planet_id IS NOT NULL')
+    # Al quitar destinos pueden aparecer duplicados, que la restricción única no permitiría
+    op.execute(
+        'DELETE FROM favourites WHERE id NOT IN ('
+        'SELECT id FROM (SELECT MIN(id) AS id FROM favourites '
+        'GROUP BY user_id, character_id, planet_id, starship_id) AS keep)'
+    )
+    with op.batch_alter_table('favourites', schema=None) as batch_op:
+        batch_op.create_check_constraint('ck_favourites_one_target', ONE_TARGET)
+
+
+def downgrade():
+    with op.batch_alter_table('favourites', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_favourites_one_target', type_='check')
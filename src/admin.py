@@ -1,14 +1,27 @@
-import os
-from flask_admin import Admin
+"""
+Panel de administración (Flask-Admin) en /admin.
+
+Flask-Admin (y wtforms, las plantillas, las cinco ModelView...) no se importa al arrancar: la
+primera petición a /admin crea una app de Flask aparte con el panel y a partir de ahí las
+peticiones a /admin van directamente a ella. Un worker que nunca sirve el admin no lo carga.
+
+    ENABLE_ADMIN=0   sin panel de administración
+"""
+import threading
+from flask import Flask
 from models import db, User, Favourites, Characters, Starships, Planets
-from flask_admin.contrib.sqla import ModelView
+
+ADMIN_PREFIX = '/admin'
+
 
 def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
+
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(ModelView(User, db.session))
     admin.add_view(ModelView(Favourites, db.session))
@@ -18,4 +31,44 @@ def setup_admin(app):
 
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+
+
+def create_admin_app(app):
+    # Misma configuración que la API (base de datos, SECRET_KEY...) pero con un pool pequeño:
+    # el admin lo usa poca gente y no debe quitarle conexiones a la API
+    admin_app = Flask(__name__)
+    admin_app.config.update(app.config)
+    options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if 'pool_size' in options:
+        options.update(pool_size=1, max_overflow=1)
+    admin_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(admin_app)
+    setup_admin(admin_app)
+    return admin_app
+
+
+class LazyAdmin:
+    # Middleware WSGI: /admin va a la app del panel (creada en la primera petición), el resto a la API
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.admin_app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == ADMIN_PREFIX or path.startswith(ADMIN_PREFIX + '/'):
+            return self.get_admin_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def get_admin_app(self):
+        if self.admin_app is None:
+            with self._lock:
+                if self.admin_app is None:
+                    self.admin_app = create_admin_app(self.app)
+        return self.admin_app
+
+
+def init_admin(app):
+    app.wsgi_app = LazyAdmin(app)
@@ -3,16 +3,36 @@ This module takes care of starting the API Server, Loading the DB and Adding the
 """
 import os
 from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.http import quote_etag
+from utils import APIException, generate_sitemap, not_modified
+from admin import init_admin
 from models import db, User, Favourites, Planets, Starships, Characters
+from catalog import CATALOG_MODELS, catalog_page, wants_stream, stream_catalog, iter_ndjson, bulk_insert
+from cache import catalog_cache
+from search import search_catalog
+from metrics import init_metrics
+from json_provider import init_json
+from favourites import parse_reference, insert_favourite, batch_update, remove_favourites
+from pool import engine_options, pool_status, env_flag
+from ratelimit import init_rate_limits
+from compression import init_compression
+from stats import init_stats, catalog_stats
+from snapshot import init_snapshot
+from popularity import top_items, TARGETS, TOP_K_SIZE
+from versions import data_etag, CATALOG
+from passwords import hash_password, verify_password, HashingBusy
+from auth import token_required, issue_tokens, decode_token, revoke, bearer_token, denylist, AuthError
 #from models import Person
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
+app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+app.config['ENABLE_ADMIN'] = env_flag('ENABLE_ADMIN', True)
+app.config['ENABLE_SWAGGER'] = env_flag('ENABLE_SWAGGER', False)
+init_json(app)
 
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -20,32 +40,81 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
-MIGRATE = Migrate(app, db)
+# Flask-Migrate (y con él Alembic) solo hace falta en los comandos flask db, no en los workers
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+    from flask_migrate import Migrate
+    MIGRATE = Migrate(app, db)
 db.init_app(app)
+init_compression(app)
 CORS(app)
-setup_admin(app)
+init_metrics(app)
+init_rate_limits(app)
+init_stats(app)
+init_snapshot(app)
+if app.config['ENABLE_ADMIN']:
+    init_admin(app)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+# El pool de hash de contraseñas está lleno: mejor que el cliente reintente que bloquear el worker
+@app.errorhandler(HashingBusy)
+def handle_hashing_busy(error):
+    return jsonify({'msg': 'Demasiadas peticiones, inténtalo de nuevo en un momento'}), 503, {'Retry-After': '1'}
+
+# ETag en todas las respuestas GET de la API: si el cliente manda If-None-Match
+# con el mismo valor le devolvemos un 304 sin cuerpo. Las rutas que pueden calcularlo
+# antes de consultar (catálogo y usuarios) lo ponen ellas y aquí se respeta.
+@app.after_request
+def add_etag(response):
+    if request.method == 'GET' and response.status_code == 200 and response.is_json \
+            and not response.is_streamed and 'ETag' not in response.headers:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
 # generate sitemap with all your endpoints
 @app.route('/')
 def sitemap():
     return generate_sitemap(app)
 
+# Especificación swagger de las rutas; flask_swagger (y PyYAML) se importan al pedirla
+if app.config['ENABLE_SWAGGER']:
+    @app.route('/spec', methods=['GET'])
+    def spec():
+        from flask_swagger import swagger
+        return jsonify(swagger(app)), 200
+
+# Readiness: comprueba que se puede sacar una conexión del pool y hablar con la base de datos
+@app.route('/ready', methods=['GET'])
+def ready():
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'msg': 'La base de datos no responde', 'pool': pool_status()}), 503
+    return jsonify({'msg': 'ok', 'pool': pool_status()}), 200
+
 
 #ENDPOINT USER
 @app.route('/users', methods=['GET'])
 def get_all_users():
+    # El ETag sale de la versión de los usuarios, antes de consultarlos (ver versions.py)
+    etag = data_etag(['user'])
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
     users=User.query.all()
     users=[user.serialize() for user in users]
 
     if not users:
-        return jsonify({'msg':'No hay usuarios'}),200
-    return jsonify ({'data': users}),200
+        return jsonify({'msg':'No hay usuarios'}),200, {'ETag': quote_etag(etag)}
+    return jsonify ({'data': users}),200, {'ETag': quote_etag(etag)}
     #Tambien podemos pasar la respues del body así:
     # response_body ={
     #     'Users': users
@@ -59,22 +128,78 @@ def add_usser():
         user=User.query.filter_by(email=data['email']).first()
         if user:
             return jsonify ({'msg':'Parece que ya te conocemos, intenta logearte'}),400
-        new_user=User(email=data['email'], password=data['password'], is_active=True)
+        new_user=User(email=data['email'], password=hash_password(data['password']), is_active=True)
         db.session.add(new_user)
         db.session.commit()
         return jsonify({'msg': 'Usuario creado', 'user': new_user.serialize()}),200
     
     return jsonify({'msg':'todos los datos son necesarios'}),400
 
+@app.route('/login', methods=['POST'])
+def login():
+    data = request.get_json(silent=True) or {}
+    email = data.get('email')
+    password = data.get('password')
+    if not isinstance(email, str) or not isinstance(password, str) or not email or not password:
+        return jsonify({'msg': 'todos los datos son necesarios'}), 400
+
+    user = User.query.filter_by(email=email).first()
+    # Si el usuario no existe se comprueba igualmente contra un hash cualquiera (mismo tiempo de respuesta)
+    valid, needs_rehash = verify_password(user.password if user else None, password)
+    if not valid:
+        return jsonify({'msg': 'Email o contraseña incorrectos'}), 401
+    if not user.is_active:
+        return jsonify({'msg': 'Tu cuenta está desactivada'}), 403
+
+    # Hash antiguo (texto plano o parámetros de coste distintos a los actuales): se rehace ahora
+    if needs_rehash:
+        user.password = hash_password(password)
+        db.session.commit()
+    return jsonify({'msg': 'Sesión iniciada', 'user': user.serialize(), **issue_tokens(user.id)}), 200
+
+@app.route('/token/refresh', methods=['POST'])
+# {"refresh_token": "..."} -> tokens nuevos; el refresh token usado queda revocado
+def refresh_token():
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token')
+    if not isinstance(token, str):
+        return jsonify({'msg': 'Falta el refresh_token'}), 400
+    try:
+        payload, expires = decode_token(token, 'refresh')
+    except AuthError as error:
+        return jsonify({'msg': error.message}), error.status_code
+    user = db.session.get(User, payload['sub'])
+    if not user or not user.is_active:
+        return jsonify({'msg': 'Tu cuenta está desactivada o no existe'}), 403
+    denylist.add(payload['jti'], expires)
+    return jsonify({'msg': 'Token renovado', **issue_tokens(user.id)}), 200
+
+@app.route('/logout', methods=['POST'])
+# Revoca el access token de la cabecera y, si viene en el cuerpo, también el refresh token
+@token_required
+def logout():
+    revoke(bearer_token(request.headers), 'access')
+    data = request.get_json(silent=True) or {}
+    if isinstance(data.get('refresh_token'), str):
+        revoke(data['refresh_token'], 'refresh')
+    return jsonify({'msg': 'Sesión cerrada'}), 200
+
 @app.route('/user/<int:id>', methods=['GET'])
+@token_required
 def get_user(id):
+    etag = data_etag([f'user.{id}'])
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
     user= User.query.get(id)
     if not user:
         return jsonify({'msg': '¡Oh no! No encontramos tu cuenta'}),404
-    return jsonify({'msg': 'mostrando usuario', 'user': user.serialize()}),200
+    return jsonify({'msg': 'mostrando usuario', 'user': user.serialize()}),200, {'ETag': quote_etag(etag)}
 
 
 @app.route('/edit_user/<int:id>', methods=['PUT'])
+@token_required
 def edit_user(id):
     data=request.json
     if data['email'] and data['is_active']:
@@ -96,6 +221,7 @@ def edit_user(id):
 
 
 @app.route('/delete_user/<int:id>', methods=['DELETE'])
+@token_required
 def delete_user(id):
      user= User.query.get(id)
      if user:
@@ -107,37 +233,51 @@ def delete_user(id):
 #---------------------------------------------------------------------------------------------------
 #ENDPOINT FAVORITOS
 @app.route('/user/<int:user_id>/favourites', methods=['GET'])
+@token_required
 def get_favourites(user_id):
-    #Recupera una instancia del modelo User desde la base de
-    #datos usando el user_id proporcionado. Si el usuario con el ID especificado 
-    # no existe, user será None.
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'msg': 'Usuario no encontrado'}), 404
+    # Los favoritos con los nombres de personaje, planeta y nave salen de una sola consulta
+    # (ver Favourites.serialize_for_user), da igual cuántos favoritos tenga el usuario.
+    # El token ya garantiza que el usuario existe y está activo, no hace falta buscarlo.
+    # Los nombres vienen del catálogo, así que su versión también cuenta para el ETag.
+    etag = data_etag([f'favourites.{user_id}', *CATALOG])
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
 
-    # Acceder a favoritos a través de la relación
-    # user.favourite se refiere a la propiedad favourite de la 
-    # instancia user que se obtiene mediante User.query.get(user_id)
-    # La relación se ha definido con back_populates, lo que significa que user.favourite 
-    # se refiere a todos los objetos de Favourites que están relacionados con este user.
-    # otra opcion 
-    #favourites = user.favourite
-
-    favourites = Favourites.query.filter_by(user_id=user_id).all()
-    favourites = [favourite.serialize() for favourite in favourites]
+    favourites = Favourites.serialize_for_user(user_id)
 
     if favourites:
-        return jsonify({'msg': 'mostrando favoritos', 'favourites': favourites}), 200
+        return jsonify({'msg': 'mostrando favoritos', 'favourites': favourites}), 200, {'ETag': quote_etag(etag)}
     return jsonify({'msg': 'No se encontraron favoritos'}), 404
 
 
+@app.route('/user/<int:user_id>/profile', methods=['GET'])
+@token_required
+# Usuario y favoritos en una sola petición (ver User.profile).
+# ?expand=character,planet,starship (o all) añade cada elemento completo a su favorito
+def get_profile(user_id):
+    expand = [name.strip() for name in request.args.get('expand', '').split(',') if name.strip()]
+    if 'all' in expand:
+        expand = list(Favourites.EXPANDABLE)
+    unknown = [name for name in expand if name not in Favourites.EXPANDABLE]
+    if unknown:
+        raise APIException('Valores de expand no validos: ' + ', '.join(unknown), 400)
+
+    etag = data_etag([f'user.{user_id}', f'favourites.{user_id}', *CATALOG], sorted(set(expand)))
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+
+    profile = User.profile(user_id, expand)
+    if profile is None:
+        return jsonify({'msg': '¡Oh no! No encontramos tu cuenta'}), 404
+    return jsonify({'msg': 'mostrando perfil', 'user': profile}), 200, {'ETag': quote_etag(etag)}
+
+
 
 @app.route('/user/<int:user_id>/favourites', methods=['POST'])
+@token_required
 def add_favourites(user_id):
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'msg': 'Usuario no encontrado'}), 404
-    
     data = request.json
     character_id = data.get('character_id')
     planet_id = data.get('planet_id')
@@ -150,39 +290,44 @@ def add_favourites(user_id):
     if favourites_count != 1:
         return jsonify({'msg': 'Debes añadir tus favoritos de uno en uno'}), 400
 
-    # Comprobar si el favorito ya existe
-    favourite = Favourites.query.filter_by(
-        user_id=user_id,
-        character_id=character_id if character_id else None,
-        planet_id=planet_id if planet_id else None,
-        starship_id=starship_id if starship_id else None
-    ).first()
-    if favourite:
+    # Un único INSERT ... ON CONFLICT DO NOTHING: si ya existía la restricción única lo descarta
+    # sin necesidad de buscarlo antes, y es correcto aunque lleguen dos peticiones a la vez
+    try:
+        column, target_id = parse_reference(data)
+    except ValueError as error:
+        return jsonify({'msg': str(error)}), 400
+    favourite_id = insert_favourite(user_id, column, target_id)
+    if favourite_id is None:
         return jsonify({'msg': 'Este elemento ya está en tus favoritos'}), 200
-    
-    # Creo el nuevo favorito
-    new_favourite = Favourites(
-        user_id=user_id,
-        character_id=character_id if character_id else None,
-        planet_id=planet_id if planet_id else None,
-        starship_id=starship_id if starship_id else None
-    )
-    db.session.add(new_favourite)
-    db.session.commit()
-    return jsonify({'msg': 'Favorito creado', 'favourite': new_favourite.serialize()}), 200
 
+    favourite = Favourites.serialize_for_user(user_id, favourite_id)[0]
+    return jsonify({'msg': 'Favorito creado', 'favourite': favourite}), 200
+
+
+
+@app.route('/user/<int:user_id>/favourites/batch', methods=['POST'])
+# Añade y quita muchos favoritos en una sola petición y una sola transacción:
+# {"add": [{"character_id": 1}, {"planet_id": 2}], "remove": [{"starship_id": 3}]}
+@token_required
+def batch_favourites(user_id):
+
+    data = request.json
+    add = data.get('add', []) if isinstance(data, dict) else None
+    remove = data.get('remove', []) if isinstance(data, dict) else None
+    if not isinstance(add, list) or not isinstance(remove, list):
+        return jsonify({'msg': 'add y remove deben ser listas'}), 400
+
+    results = batch_update(user_id, add, remove)
+    return jsonify({'msg': 'Favoritos actualizados', 'results': results}), 200
 
 
 @app.route('/user/<int:user_id>/favourites/<int:favourite_id>', methods=['DELETE'])
+@token_required
 def delete_favourites(user_id, favourite_id):
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'msg': 'Usuario no encontrado'}), 404
-    
     favourite = Favourites.query.filter_by(id=favourite_id, user_id=user_id).first()
     
-    if favourite:
-         db.session.delete(favourite)
+    # Si otra petición lo ha borrado entre la consulta y el DELETE tampoco se ha encontrado
+    if favourite and remove_favourites([favourite]):
          db.session.commit()
          return jsonify({'msg':'Favorito eliminado'}),204
     return jsonify({'msg':'no se encontró favorito a eliminar'}), 404
@@ -191,33 +336,92 @@ def delete_favourites(user_id, favourite_id):
 #ENDPOINT MOSTRAR PLANETAS, PERSONAJES Y NAVES
 @app.route('/planets', methods=['GET'])
 def show_planets():
-    planets=Planets.query.all()
-    planets = [planet.serialize() for planet in planets]
+    if wants_stream(request):
+        return stream_catalog(Planets, request.args)
+
+    planets, next_cursor, etag = catalog_page(Planets, request.args)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
 
     if not planets:
         return jsonify({'msg': 'No hay planetas que mostrar'}),404
     
-    return jsonify({'msg': 'mostrando planetas', 'planets':planets}),200
+    return jsonify({'msg': 'mostrando planetas', 'planets':planets, 'next': next_cursor}),200, {'ETag': quote_etag(etag)}
 
 @app.route('/starships', methods=['GET'])
 def show_starships():
-    starships=Starships.query.all()
-    starships = [starship.serialize() for starship in starships]
+    if wants_stream(request):
+        return stream_catalog(Starships, request.args)
+
+    starships, next_cursor, etag = catalog_page(Starships, request.args)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
 
     if not starships:
         return jsonify({'msg': 'No hay naves que mostrar'}),404
     
-    return jsonify({'msg': 'mostrando naves', 'starships': starships}),200
+    return jsonify({'msg': 'mostrando naves', 'starships': starships, 'next': next_cursor}),200, {'ETag': quote_etag(etag)}
 
 @app.route('/characters', methods=['GET'])
 def show_characters():
-    characters=Characters.query.all()
-    characters = [character.serialize() for character in characters]
+    if wants_stream(request):
+        return stream_catalog(Characters, request.args)
+
+    characters, next_cursor, etag = catalog_page(Characters, request.args)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
 
     if not characters:
         return jsonify({'msg': 'No hay personajes que mostrar'}),404
     
-    return jsonify({'msg': 'mostrando personajes', 'characters':characters}),200
+    return jsonify({'msg': 'mostrando personajes', 'characters':characters, 'next': next_cursor}),200, {'ETag': quote_etag(etag)}
+
+@app.route('/search', methods=['GET'])
+#/search?q=sky&limit=10
+def search():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'msg': 'El parámetro q es obligatorio'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        return jsonify({'msg': 'limit debe ser un número entero'}), 400
+    if limit < 1:
+        return jsonify({'msg': 'limit debe ser mayor que 0'}), 400
+
+    # Resultados de personajes, planetas y naves juntos, ordenados por relevancia
+    results = search_catalog(q, limit)
+    return jsonify({'msg': 'resultados de la busqueda', 'results': results}), 200
+
+@app.route('/stats', methods=['GET'])
+# Totales del catálogo y lo más añadido a favoritos, sin recorrer las tablas (ver stats.py)
+def stats():
+    return jsonify({'msg': 'estadísticas del catálogo', **catalog_stats()}), 200
+
+
+@app.route('/top', methods=['GET'])
+#/top?type=planets&limit=10
+# Ranking de lo más añadido a favoritos, desde los contadores y el top-K en memoria (ver popularity.py)
+def top():
+    target_type = request.args.get('type')
+    if target_type not in TARGETS:
+        return jsonify({'msg': 'type debe ser characters, planets o starships'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'msg': 'limit debe ser un número entero'}), 400
+    if limit < 1 or limit > TOP_K_SIZE:
+        return jsonify({'msg': f'limit debe estar entre 1 y {TOP_K_SIZE}'}), 400
+    return jsonify({'msg': 'mostrando ranking', 'type': target_type, 'top': top_items(target_type, limit)}), 200
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    # Aciertos, fallos y expulsiones de la caché del catálogo, para poder dimensionarla
+    return jsonify({'msg': 'estadisticas de la cache', 'catalog': catalog_cache.stats()}),200
 
 
 #--------------------------------------------------------------------------------------------------
@@ -226,9 +430,25 @@ def show_characters():
 #/add_datas?type=characters
 #/add_datas?type=planets
 #/add_datas?type=starships
+#Carga por lotes: el cuerpo puede ser un array JSON o NDJSON (Content-Type: application/x-ndjson)
 def add_datas():
     data_type = request.args.get('type')
 
+    if request.mimetype == 'application/x-ndjson':
+        items = iter_ndjson(request.stream)
+    elif request.is_json and isinstance(request.json, list):
+        items = request.json
+    else:
+        items = None
+
+    if items is not None:
+        model = CATALOG_MODELS.get(data_type)
+        if not model:
+            return jsonify({'msg': 'Tipo de dato no valido'}), 400
+        inserted, errors = bulk_insert(model, items)
+        status = 201 if inserted else 400
+        return jsonify({'msg': f'{inserted} {data_type} creados', 'inserted': inserted, 'errors': errors}), status
+
     if data_type == 'characters':
         data = request.json
         new_data = Characters(
@@ -0,0 +1,283 @@
+"""
+Punto de entrada ASGI, alternativo a wsgi.py. Las rutas de lectura se sirven con handlers
+asíncronos y un driver asíncrono (asyncpg en Postgres, aiosqlite en SQLite), así un proceso
+puede tener muchas peticiones esperando a la base de datos o a clientes lentos a la vez.
+El resto de rutas (escrituras, admin, exportaciones en streaming...) pasan a la app de Flask
+de siempre en un pool de hilos, por lo que la API es exactamente la misma.
+
+    uvicorn asgi:application --app-dir src --port 3000
+    gunicorn asgi:application --chdir ./src/ -k uvicorn.workers.UvicornWorker
+
+En el Procfile se elige con SERVER_MODE=asgi (por defecto wsgi).
+"""
+import os
+import re
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from werkzeug.datastructures import MultiDict, Headers
+from werkzeug.http import parse_etags, quote_etag, unquote_etag
+from app import app
+from models import User, Favourites, Planets, Starships, Characters
+from catalog import page_key, make_page, parse_limit, build_selects, rows_to_page
+from cache import catalog_cache
+from pool import engine_options, env_flag
+from utils import APIException
+from auth import AuthError, decode_token, bearer_token, check_owner, user_status
+from versions import etag_query, version_etag, CATALOG
+import ratelimit
+import compression
+
+flask_application = WsgiToAsgi(app)
+
+
+def async_url(url):
+    if url.startswith('postgresql://'):
+        return 'postgresql+asyncpg://' + url[len('postgresql://'):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+
+def async_engine_options(url):
+    # Mismos ajustes que el pool síncrono salvo la clase, que aquí la pone SQLAlchemy, y el
+    # tamaño: un solo proceso atiende muchas peticiones a la vez (ASYNC_DB_POOL_SIZE)
+    options = engine_options(url)
+    if options.get('poolclass') is not NullPool:
+        options.pop('poolclass', None)
+    if 'pool_size' in options:
+        options['pool_size'] = int(os.getenv('ASYNC_DB_POOL_SIZE', 10))
+        options['max_overflow'] = int(os.getenv('ASYNC_DB_MAX_OVERFLOW', 10))
+    options.pop('connect_args', None)
+    if env_flag('DB_PGBOUNCER', False) and url.startswith('postgresql'):
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    return options
+
+
+database_url = app.config['SQLALCHEMY_DATABASE_URI']
+engine = create_async_engine(async_url(database_url), **async_engine_options(database_url))
+
+
+class Request:
+    def __init__(self, scope):
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope['headers']])
+
+
+def json_response(payload, status=200, etag=None):
+    # Mismo formato compacto que jsonify fuera de modo debug
+    body = (app.json.dumps(payload, separators=(',', ':')) + '\n').encode()
+    # Misma cabecera CORS que pone flask_cors con CORS(app)
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+               (b'access-control-allow-origin', b'*')]
+    if etag:
+        headers.append((b'etag', quote_etag(etag).encode()))
+    return status, headers, body
+
+
+def not_modified(request, etag):
+    if parse_etags(request.headers.get('If-None-Match')).contains_weak(etag):
+        return 304, [(b'etag', quote_etag(etag).encode())], b''
+    return None
+
+
+async def fetch_all(stmt):
+    async with engine.connect() as conn:
+        return (await conn.execute(stmt)).all()
+
+
+#--------------------------------------------------------------------------------------------------
+#RUTAS DE LECTURA ASÍNCRONAS (mismas respuestas que en app.py)
+
+def wants_stream(request):
+    return request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+
+def catalog_handler(model, key, msg, empty_msg):
+    async def handler(request):
+        cache_key = page_key(model, request.args)
+        page = catalog_cache.get(cache_key)
+        if page is None:
+            limit = parse_limit(request.args)
+            stmts, sort_column = build_selects(model, request.args, engine.dialect.name)
+            rows = []
+            for stmt in stmts:
+                rows += await fetch_all(stmt.limit(limit + 1 - len(rows)))
+                if len(rows) > limit:
+                    break
+            page = make_page(*rows_to_page(rows, limit, sort_column))
+            catalog_cache.set(cache_key, page)
+
+        rows, next_cursor, etag = page
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+        if not rows:
+            return json_response({'msg': empty_msg}, 404)
+        return json_response({'msg': msg, key: rows, 'next': next_cursor}, 200, etag)
+    # Las exportaciones NDJSON las sirve Flask (ver application)
+    handler.streams = True
+    return handler
+
+
+async def data_etag(names):
+    # Como versions.data_etag: el ETag sale de las versiones, antes de consultar los datos
+    names, stmt = etag_query(names)
+    return version_etag(names, await fetch_all(stmt))
+
+
+async def get_all_users(request):
+    etag = await data_etag(['user'])
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+    rows = await fetch_all(select(User.id, User.email, User.is_active))
+    users = [dict(row._mapping) for row in rows]
+    if not users:
+        return json_response({'msg': 'No hay usuarios'}, 200, etag)
+    return json_response({'data': users}, 200, etag)
+
+
+async def user_is_active(user_id):
+    # Misma caché que auth.user_is_active, pero la consulta de un fallo va por el driver asíncrono
+    status = user_status.get(user_id)
+    if status is None:
+        rows = await fetch_all(select(User.is_active).where(User.id == user_id))
+        status = bool(rows and rows[0][0])
+        user_status.set(user_id, status)
+    return status
+
+
+def token_required(handler):
+    # Como auth.token_required: el token tiene que ser del usuario de la URL
+    async def wrapper(request, user_id):
+        try:
+            payload, _ = decode_token(bearer_token(request.headers), 'access')
+            check_owner(payload, user_id, await user_is_active(payload['sub']))
+        except AuthError as error:
+            status, headers, body = json_response({'msg': error.message}, error.status_code)
+            if error.status_code == 401:
+                headers.append((b'www-authenticate', b'Bearer'))
+            return status, headers, body
+        return await handler(request, user_id)
+    return wrapper
+
+
+@token_required
+async def get_user(request, id):
+    etag = await data_etag([f'user.{id}'])
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+    rows = await fetch_all(select(User.id, User.email, User.is_active).where(User.id == id))
+    if not rows:
+        return json_response({'msg': '¡Oh no! No encontramos tu cuenta'}, 404)
+    return json_response({'msg': 'mostrando usuario', 'user': dict(rows[0]._mapping)}, 200, etag)
+
+
+@token_required
+async def get_favourites(request, user_id):
+    etag = await data_etag([f'favourites.{user_id}', *CATALOG])
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+    favourites = [dict(row._mapping) for row in await fetch_all(Favourites.serialized_select(user_id))]
+    if favourites:
+        return json_response({'msg': 'mostrando favoritos', 'favourites': favourites}, 200, etag)
+    return json_response({'msg': 'No se encontraron favoritos'}, 404)
+
+
+# (patrón, endpoint de Flask equivalente para las políticas de ratelimit.py, handler)
+ROUTES = [
+    (re.compile(r'^/planets/?$'), 'show_planets', catalog_handler(Planets, 'planets', 'mostrando planetas', 'No hay planetas que mostrar')),
+    (re.compile(r'^/starships/?$'), 'show_starships', catalog_handler(Starships, 'starships', 'mostrando naves', 'No hay naves que mostrar')),
+    (re.compile(r'^/characters/?$'), 'show_characters', catalog_handler(Characters, 'characters', 'mostrando personajes', 'No hay personajes que mostrar')),
+    (re.compile(r'^/users/?$'), 'get_all_users', get_all_users),
+    (re.compile(r'^/user/(\d+)/?$'), 'get_user', get_user),
+    (re.compile(r'^/user/(\d+)/favourites/?$'), 'get_favourites', get_favourites),
+]
+
+
+def match(path):
+    for pattern, endpoint, handler in ROUTES:
+        found = pattern.match(path)
+        if found:
+            return endpoint, handler, [int(value) for value in found.groups()]
+    return None, None, None
+
+
+def rate_limit(request, endpoint, scope):
+    # Mismas políticas y contadores que las rutas de Flask (ver ratelimit.py)
+    client = scope.get('client') or ('', 0)
+    result = ratelimit.check(endpoint, request.headers, client[0])
+    if result is None:
+        return None, []
+    allowed, headers = result
+    headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    if not allowed:
+        status, response_headers, body = json_response({'msg': 'Demasiadas peticiones, inténtalo de nuevo más tarde'}, 429)
+        return (status, response_headers + headers, body), headers
+    return None, headers
+
+
+def compress(request, endpoint, response):
+    # Como compression.py en Flask: Vary en todas y el cuerpo comprimido (y el ETag débil) si el
+    # cliente lo acepta y pasa del tamaño mínimo. Comparte la caché de cuerpos comprimidos
+    status, headers, body = response
+    if not compression.COMPRESSION_ENABLED or status in compression.SKIP_STATUS and status != 304:
+        return response
+    headers = headers + [(b'vary', b'Accept-Encoding')]
+    etag = next((value.decode() for name, value in headers if name == b'etag'), None)
+    etag = unquote_etag(etag)[0] if etag else None
+    if status == 304:
+        if etag and compression.weak_validator(parse_etags(request.headers.get('If-None-Match')), etag):
+            headers = [(name, value) for name, value in headers if name != b'etag']
+            headers.append((b'etag', quote_etag(etag, weak=True).encode()))
+        return status, headers, body
+    coding, data = compression.encode(request.headers.get('Accept-Encoding'), body, 'application/json', etag, endpoint)
+    if coding is None:
+        return status, headers, body
+    headers = [(name, value) for name, value in headers if name not in (b'content-length', b'etag')]
+    headers += [(b'content-length', str(len(data)).encode()), (b'content-encoding', coding.encode())]
+    if etag:
+        headers.append((b'etag', quote_etag(etag, weak=True).encode()))
+    return status, headers, data
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        endpoint, handler, params = match(scope['path'])
+        request = Request(scope) if handler else None
+        if handler and not (getattr(handler, 'streams', False) and wants_stream(request)):
+            response, limit_headers = rate_limit(request, endpoint, scope)
+            if response is None:
+                try:
+                    response = await handler(request, *params)
+                except APIException as error:
+                    response = json_response(error.to_dict(), error.status_code)
+                response = (response[0], response[1] + limit_headers, response[2])
+            status, headers, body = compress(request, endpoint, response)
+            return await send_response(send, status, headers, b'' if scope['method'] == 'HEAD' else body)
+
+    await flask_application(scope, receive, send)
@@ -0,0 +1,161 @@
+"""
+Autenticación con tokens firmados (itsdangerous, ya viene con Flask).
+
+/login devuelve un access token corto (ACCESS_TOKEN_TTL) y un refresh token largo
+(REFRESH_TOKEN_TTL). Comprobar un access token no toca la base de datos: se verifica la firma
+y la caducidad, se mira una lista de revocados en memoria (logout) y el is_active del usuario
+se guarda en una caché con TTL (USER_STATUS_TTL) que se invalida al hacer commit de cambios en
+el usuario. Así las rutas protegidas no hacen consultas extra por la autenticación.
+
+La lista de revocados y la caché son de cada proceso: con varios workers un logout vale en el
+worker que lo recibe y en el resto el token sigue valiendo como mucho hasta que caduca.
+"""
+import os
+import secrets
+import threading
+import time
+from functools import wraps
+from flask import request, jsonify, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from cache import LRUCache, on_commit
+from models import db, User
+
+SECRET_KEY = os.getenv('AUTH_SECRET_KEY') or os.getenv('FLASK_APP_KEY', 'sample key')
+ACCESS_TOKEN_TTL = int(os.getenv('ACCESS_TOKEN_TTL', 900))
+REFRESH_TOKEN_TTL = int(os.getenv('REFRESH_TOKEN_TTL', 7 * 24 * 3600))
+
+_serializers = {
+    'access': URLSafeTimedSerializer(SECRET_KEY, salt='access-token'),
+    'refresh': URLSafeTimedSerializer(SECRET_KEY, salt='refresh-token')
+}
+_ttls = {'access': ACCESS_TOKEN_TTL, 'refresh': REFRESH_TOKEN_TTL}
+
+user_status = LRUCache(
+    maxsize=int(os.getenv('USER_STATUS_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('USER_STATUS_TTL', 60))
+)
+
+
+class AuthError(Exception):
+    def __init__(self, message, status_code=401):
+        Exception.__init__(self)
+        self.message = message
+        self.status_code = status_code
+
+
+class Denylist:
+    # Ids (jti) de tokens revocados hasta que caducan; los vencidos se limpian al añadir
+    def __init__(self):
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def add(self, jti, expires):
+        now = time.time()
+        with self._lock:
+            self._expires[jti] = expires
+            if now >= self._next_purge:
+                for key in [key for key, value in self._expires.items() if value <= now]:
+                    del self._expires[key]
+                self._next_purge = now + 60
+
+    def __contains__(self, jti):
+        expires = self._expires.get(jti)
+        return expires is not None and expires > time.time()
+
+    def __len__(self):
+        return len(self._expires)
+
+
+denylist = Denylist()
+
+
+def issue_token(user_id, kind):
+    return _serializers[kind].dumps({'sub': user_id, 'jti': secrets.token_urlsafe(12)})
+
+
+def issue_tokens(user_id):
+    return {
+        'access_token': issue_token(user_id, 'access'),
+        'refresh_token': issue_token(user_id, 'refresh'),
+        'token_type': 'Bearer',
+        'expires_in': ACCESS_TOKEN_TTL
+    }
+
+
+def decode_token(token, kind):
+    # Devuelve (payload, caducidad) o lanza AuthError. Solo CPU, sin base de datos
+    try:
+        payload, issued = _serializers[kind].loads(token, max_age=_ttls[kind], return_timestamp=True)
+    except SignatureExpired:
+        raise AuthError('El token ha caducado')
+    except BadSignature:
+        raise AuthError('Token no válido')
+    if payload.get('jti') in denylist:
+        raise AuthError('El token ha sido revocado')
+    return payload, issued.timestamp() + _ttls[kind]
+
+
+def revoke(token, kind):
+    try:
+        payload, expires = decode_token(token, kind)
+    except AuthError:
+        return False
+    denylist.add(payload['jti'], expires)
+    return True
+
+
+def bearer_token(headers):
+    scheme, _, token = (headers.get('Authorization') or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise AuthError('Falta el token de acceso (Authorization: Bearer ...)')
+    return token.strip()
+
+
+def check_owner(payload, user_id, is_active):
+    # is_active es None si el usuario no existe
+    if user_id is not None and payload['sub'] != user_id:
+        raise AuthError('No puedes acceder a los datos de otro usuario', 403)
+    if not is_active:
+        raise AuthError('Tu cuenta está desactivada o no existe', 403)
+
+
+def user_is_active(user_id):
+    # Caché por usuario; solo en un fallo se consulta la base de datos
+    status = user_status.get(user_id)
+    if status is None:
+        status = bool(db.session.execute(db.select(User.is_active).where(User.id == user_id)).scalar())
+        user_status.set(user_id, status)
+    return status
+
+
+def authenticate(user_id=None):
+    payload, _ = decode_token(bearer_token(request.headers), 'access')
+    check_owner(payload, user_id, user_is_active(payload['sub']))
+    return payload['sub']
+
+
+def token_required(view):
+    # Protege rutas /user/<id>/...: el token tiene que ser del mismo usuario que la URL
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            g.user_id = authenticate(kwargs.get('user_id', kwargs.get('id')))
+        except AuthError as error:
+            headers = {'WWW-Authenticate': 'Bearer'} if error.status_code == 401 else {}
+            return jsonify({'msg': error.message}), error.status_code, headers
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Cambios en usuarios (edit_user, delete_user, admin...): se olvida su estado al hacer commit
+def _collect_changed_users(session, changes, pending):
+    pending.extend(obj.id for obj, _ in changes.get(User.__tablename__, ()))
+
+
+def _forget_changed_users(user_ids):
+    for user_id in user_ids:
+        user_status.discard(lambda key: key == user_id)
+
+
+on_commit('changed_users', _collect_changed_users, _forget_changed_users)
@@ -0,0 +1,152 @@
+"""
+Caché en memoria (LRU + TTL) para las respuestas de lectura.
+Cada tabla tiene un número de versión que sube cuando se confirma (commit) un cambio
+en ella desde cualquier sesión de SQLAlchemy, incluido Flask-Admin.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is MISSING:
+                self.misses += 1
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, match):
+        # Borra las entradas cuya clave cumpla match(key)
+        with self._lock:
+            for key in [key for key in self._data if match(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+catalog_cache = LRUCache(
+    maxsize=int(os.getenv('CATALOG_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', 300))
+)
+
+_table_versions = {}
+_versions_lock = threading.Lock()
+
+
+def table_version(table):
+    return _table_versions.get(table, 0)
+
+
+def invalidate_tables(tables):
+    # Las claves de caché empiezan por el nombre de la tabla (ver catalog.catalog_page)
+    tables = set(tables)
+    if not tables:
+        return
+    with _versions_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+    catalog_cache.discard(lambda key: key[0] in tables)
+
+
+#--------------------------------------------------------------------------------------------------
+#CAMBIOS CONFIRMADOS
+# Un solo juego de eventos de sesión para todo lo que se guarda en memoria (páginas en caché,
+# estado de los usuarios, índice de búsqueda, top-K de favoritos): en cada flush se agrupan una
+# vez los objetos tocados por tabla y cada hook apunta lo que necesite. Solo se aplica cuando el
+# commit se ha hecho, así una petición concurrente no vuelve a cachear datos viejos; con un
+# rollback se descarta.
+
+_commit_hooks = {}
+
+
+def on_commit(name, collect, apply):
+    # collect(session, changes, pending) en cada flush: changes es {tabla: [(objeto, borrado), ...]}
+    # y pending la lista del hook en esta sesión. apply(pending) después del commit si no está vacía
+    _commit_hooks[name] = (collect, apply)
+
+
+def pending_changes(session, name):
+    # Para apuntar cambios que no pasan por el flush del ORM (INSERT de core, por ejemplo)
+    return session.info.setdefault('pending_commit', {}).setdefault(name, [])
+
+
+def flush_changes(session, name):
+    # Dict para lo que apuntan los eventos del mapper durante un flush; los hooks lo leen en su
+    # collect y se descarta al terminar el flush (o con un rollback si el flush falla)
+    return session.info.setdefault('pending_flush', {}).setdefault(name, {})
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    changes = {}
+    for deleted, objects in ((False, chain(session.new, session.dirty)), (True, session.deleted)):
+        for obj in objects:
+            table = getattr(obj, '__tablename__', None)
+            if table:
+                changes.setdefault(table, []).append((obj, deleted))
+    for name, (collect, _) in _commit_hooks.items():
+        collect(session, changes, pending_changes(session, name))
+    session.info.pop('pending_flush', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    pending = session.info.pop('pending_commit', {})
+    for name, (_, apply) in _commit_hooks.items():
+        if pending.get(name):
+            apply(pending[name])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changes(session, previous_transaction):
+    session.info.pop('pending_commit', None)
+    session.info.pop('pending_flush', None)
+
+
+on_commit('changed_tables', lambda session, changes, pending: pending.extend(changes), invalidate_tables)
@@ -0,0 +1,349 @@
+"""
+Consultas y cargas del catálogo (planetas, naves y personajes).
+Paginación por cursor (keyset), filtros y orden sobre columnas indexadas, proyección con ?fields=,
+exportación completa en streaming (NDJSON) y carga masiva por lotes para /add_datas
+"""
+import base64
+import json
+import operator
+import os
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select, tuple_, Integer, String, Enum
+from sqlalchemy.exc import SQLAlchemyError
+from utils import APIException, content_etag
+from records import rows_to_records
+from models import db, Characters, Planets, Starships
+from cache import catalog_cache, table_version, invalidate_tables
+from stats import apply_deltas, deltas_for
+from versions import bump
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 1000))
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 1000))
+
+CATALOG_MODELS = {
+    'characters': Characters,
+    'planets': Planets,
+    'starships': Starships
+}
+
+RESERVED_ARGS = ('limit', 'after', 'fields', 'stream', 'sort')
+FILTER_OPS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le
+}
+
+INVALID_JSON = object()
+
+# Dialectos en los que NULL es mayor que cualquier valor (al final en ASC, al principio en DESC)
+NULLS_LARGEST = ('postgresql', 'oracle')
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    # El cursor es opaco para el cliente, solo tiene que devolvernos el 'next' que le dimos
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise APIException('Cursor no valido', 400)
+    if not isinstance(values, list) or len(values) != size:
+        raise APIException('Cursor no valido', 400)
+    # El último valor siempre es el id (True también es un int en Python)
+    if not isinstance(values[-1], int) or isinstance(values[-1], bool):
+        raise APIException('Cursor no valido', 400)
+    return values
+
+
+def parse_limit(args):
+    raw = args.get('limit')
+    if raw is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise APIException('limit debe ser un número entero', 400)
+    if limit < 1:
+        raise APIException('limit debe ser mayor que 0', 400)
+    return min(limit, MAX_LIMIT)
+
+
+def parse_sort(model, args):
+    # ?sort=cost_in_credits (ascendente) o ?sort=-cost_in_credits (descendente)
+    raw = args.get('sort')
+    if not raw:
+        return None, False
+    name = raw.lstrip('-')
+    if name not in model.SORTABLE:
+        raise APIException(f'No se puede ordenar por {name}', 400)
+    return model.__table__.columns[name], raw.startswith('-')
+
+
+def parse_value(column, value):
+    if isinstance(column.type, Integer):
+        try:
+            return int(value)
+        except ValueError:
+            raise APIException(f'{column.name} debe ser un número entero', 400)
+    if isinstance(column.type, Enum) and value not in column.type.enums:
+        raise APIException(f'{column.name} debe ser uno de: ' + ', '.join(column.type.enums), 400)
+    return value
+
+
+def apply_filters(stmt, model, args):
+    # ?climate=arid, ?cost_in_credits__gte=1000, ?gender__ne=male ...
+    # Solo se puede filtrar por las columnas de model.FILTERABLE, que tienen índice
+    columns = model.__table__.columns
+    for key, value in args.items(multi=True):
+        if key in RESERVED_ARGS:
+            continue
+        name, _, op = key.partition('__')
+        op = op or 'eq'
+        if name not in model.FILTERABLE or op not in FILTER_OPS:
+            raise APIException(f'Filtro no permitido: {key}', 400)
+        column = columns[name]
+        stmt = stmt.where(FILTER_OPS[op](column, parse_value(column, value)))
+    return stmt
+
+
+def select_columns(model, fields, sort_column=None):
+    columns = model.__table__.columns
+    if not fields:
+        return list(columns)
+
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise APIException('Campos no validos: ' + ', '.join(unknown), 400)
+    # El id (y la columna de orden si la hay) siempre se seleccionan porque forman el cursor
+    selected = [columns.id]
+    if sort_column is not None and sort_column.name != 'id':
+        selected.append(sort_column)
+    return selected + [columns[name] for name in names if columns[name] not in selected]
+
+
+def cursor_value(column, value):
+    # El valor de la columna de orden tiene que ser del tipo de la columna (o null)
+    expected = int if isinstance(column.type, Integer) else str
+    if value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+        raise APIException('Cursor no valido', 400)
+    return value
+
+
+def row_cursor(row, sort_column):
+    if sort_column is None:
+        return encode_cursor([row.id])
+    return encode_cursor([row._mapping[sort_column.name], row.id])
+
+
+def build_selects(model, args, dialect):
+    # SELECTs con la proyección, los filtros, el orden y el cursor de la petición; la página son
+    # las primeras filas de ejecutarlos en orden. Con ?sort= el id desempata en el mismo sentido
+    # y los NULL van donde los pone cada base de datos, así el índice (columna, id) sirve el orden
+    # y el cursor es una comparación de tuplas. Si la página pasa de los valores a los NULL (o al
+    # revés) son dos consultas, cada una sobre su tramo del índice, en vez de un OR que obliga a
+    # recorrer y ordenar la tabla entera.
+    sort_column, descending = parse_sort(model, args)
+    stmt = select(*select_columns(model, args.get('fields'), sort_column))
+    stmt = apply_filters(stmt, model, args)
+    after = args.get('after')
+
+    if sort_column is None:
+        stmt = stmt.order_by(model.id)
+        if after:
+            last_id, = decode_cursor(after, 1)
+            stmt = stmt.where(model.id > last_id)
+        return [stmt], sort_column
+
+    if descending:
+        stmt = stmt.order_by(sort_column.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(sort_column, model.id)
+    if not after:
+        return [stmt], sort_column
+
+    last_value, last_id = decode_cursor(after, 2)
+    last_value = cursor_value(sort_column, last_value)
+    beyond = operator.lt if descending else operator.gt
+    nulls_last = (dialect in NULLS_LARGEST) != descending
+    if last_value is None:
+        rest = stmt.where(sort_column.is_(None), beyond(model.id, last_id))
+        following = [] if nulls_last else [stmt.where(sort_column.is_not(None))]
+    else:
+        rest = stmt.where(beyond(tuple_(sort_column, model.id), tuple_(last_value, last_id)))
+        following = [stmt.where(sort_column.is_(None))] if nulls_last else []
+    return [rest] + following, sort_column
+
+
+def page_key(model, args):
+    # La clave incluye la versión de la tabla: un commit que la cambie deja la entrada inservible
+    table = model.__tablename__
+    return (table, table_version(table), tuple(sorted(args.items(multi=True))))
+
+
+def make_page(rows, next_cursor):
+    # El ETag se calcula una vez al llenar la caché, los aciertos no vuelven a serializar
+    return (rows, next_cursor, content_etag([rows, next_cursor]))
+
+
+def catalog_page(model, args):
+    # /planets?limit=50&after=<next>&fields=name,climate&climate=arid&sort=-population
+    key = page_key(model, args)
+    page = catalog_cache.get(key)
+    if page is None:
+        page = make_page(*query_page(model, args))
+        catalog_cache.set(key, page)
+    return page
+
+
+def query_page(model, args):
+    limit = parse_limit(args)
+    stmts, sort_column = build_selects(model, args, db.engine.dialect.name)
+    # Pedimos una fila de más para saber si hay otra página sin hacer un COUNT
+    rows = []
+    for stmt in stmts:
+        rows += db.session.execute(stmt.limit(limit + 1 - len(rows))).all()
+        if len(rows) > limit:
+            break
+    return rows_to_page(rows, limit, sort_column)
+
+
+def rows_to_page(rows, limit, sort_column):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = row_cursor(rows[-1], sort_column)
+    # Registros con __slots__ (records.py): es lo que se queda en catalog_cache
+    return rows_to_records(rows), next_cursor
+
+
+#--------------------------------------------------------------------------------------------------
+#EXPORTACIÓN EN STREAMING
+
+def wants_stream(request):
+    # /planets?stream=1 o la cabecera Accept: application/x-ndjson
+    if request.args.get('stream') == '1':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def stream_catalog(model, args):
+    # Exporta la tabla entera como NDJSON (una fila por línea). Con stream_results el driver usa
+    # un cursor de servidor y vamos enviando bloques de STREAM_BATCH_SIZE filas según llegan,
+    # así la memoria no depende del tamaño de la tabla. Admite los mismos filtros, orden, ?fields= y ?after= que las páginas.
+    stmts, _ = build_selects(model, args, db.engine.dialect.name)
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        for stmt in stmts:
+            result = db.session.execute(stmt.execution_options(stream_results=True))
+            try:
+                for rows in result.partitions(STREAM_BATCH_SIZE):
+                    yield ''.join(dumps(row) + '\n' for row in rows_to_records(rows))
+            finally:
+                result.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+#--------------------------------------------------------------------------------------------------
+#CARGA MASIVA
+
+def iter_ndjson(stream):
+    # Una fila JSON por línea, se va leyendo del cuerpo de la petición sin cargarlo entero
+    loads = current_app.json.loads
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield loads(line)
+        except ValueError:
+            yield INVALID_JSON
+
+
+def validate_row(model, data):
+    # Devuelve (fila, None) si es válida o (None, error). Todas las filas llevan las mismas
+    # claves (las que faltan van a None) para que el INSERT se pueda hacer con executemany.
+    if data is INVALID_JSON:
+        return None, 'JSON no valido'
+    if not isinstance(data, dict):
+        return None, 'Cada elemento debe ser un objeto'
+
+    columns = model.__table__.columns
+    unknown = [key for key in data if key not in columns or columns[key].primary_key]
+    if unknown:
+        return None, 'Campos no validos: ' + ', '.join(unknown)
+
+    row = {}
+    for column in columns:
+        if column.primary_key:
+            continue
+        value = data.get(column.name)
+        if value is None:
+            if not column.nullable:
+                return None, f'{column.name} es obligatorio'
+        elif isinstance(column.type, Enum):
+            if value not in column.type.enums:
+                return None, f'{column.name} debe ser uno de: ' + ', '.join(column.type.enums)
+        elif isinstance(column.type, Integer):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return None, f'{column.name} debe ser un número entero'
+        elif isinstance(column.type, String):
+            if not isinstance(value, str):
+                return None, f'{column.name} debe ser un texto'
+            if column.type.length and len(value) > column.type.length:
+                return None, f'{column.name} no puede tener más de {column.type.length} caracteres'
+        row[column.name] = value
+    return row, None
+
+
+def bulk_insert(model, items):
+    # Valida cada fila y las inserta en bloques de BATCH_CHUNK_SIZE, un commit por bloque.
+    # Las filas con errores se saltan y se devuelven con su posición, sin parar el lote.
+    inserted = 0
+    errors = []
+    chunk = []
+    chunk_start = 0
+
+    for index, item in enumerate(items):
+        row, error = validate_row(model, item)
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        if not chunk:
+            chunk_start = index
+        chunk.append(row)
+        if len(chunk) >= BATCH_CHUNK_SIZE:
+            inserted += insert_chunk(model, chunk, chunk_start, index, errors)
+            chunk = []
+    if chunk:
+        inserted += insert_chunk(model, chunk, chunk_start, index, errors)
+
+    # Un INSERT de core no pasa por los eventos de sesión, así que invalidamos a mano
+    if inserted:
+        invalidate_tables([model.__tablename__])
+    return inserted, errors
+
+
+def insert_chunk(model, rows, first, last, errors):
+    try:
+        db.session.execute(model.__table__.insert(), rows)
+        # Los contadores de /stats y la versión de la tabla en la misma transacción que el bloque
+        apply_deltas(db.session.connection(), deltas_for(model, rows))
+        bump(db.session.connection(), [model.__tablename__])
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        errors.append({'from_index': first, 'to_index': last, 'error': str(getattr(error, 'orig', None) or error)})
+        return 0
+    return len(rows)
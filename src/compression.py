@@ -0,0 +1,199 @@
+"""
+Compresión de las respuestas (gzip, br o zstd) negociada con la cabecera Accept-Encoding.
+
+Solo se comprimen los tipos de texto (JSON, NDJSON, HTML...) y los cuerpos de al menos
+COMPRESSION_MIN_SIZE bytes: por debajo la cabecera de gzip y la CPU no compensan. Las
+exportaciones en streaming se comprimen bloque a bloque, sin esperar a tener el cuerpo entero.
+
+Los cuerpos con ETag (las páginas del catálogo, /users...) se guardan ya comprimidos por
+(ruta, ETag, codificación): la siguiente petición con el mismo contenido no vuelve a comprimir.
+Al comprimir el ETag pasa a ser débil (W/"..."), como hace nginx, porque el cuerpo ya no es
+el mismo byte a byte; If-None-Match lo sigue reconociendo y el 304 lo devuelve débil, con el
+mismo Vary que el 200.
+
+    COMPRESSION_ENABLED=1
+    COMPRESSION_MIN_SIZE=1024
+    COMPRESSION_ALGORITHMS=zstd,br,gzip   preferencia si el cliente acepta varias con el mismo q
+    COMPRESSION_GZIP_LEVEL=6, COMPRESSION_BR_QUALITY=4, COMPRESSION_ZSTD_LEVEL=3
+    COMPRESSION_CACHE_SIZE=256            cuerpos comprimidos guardados en cada proceso
+
+br necesita el paquete brotli y zstd el paquete zstandard; si no están instalados solo se ofrece gzip.
+"""
+import gzip
+import os
+import zlib
+from flask import request
+from werkzeug.http import parse_accept_header
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', '1') == '1'
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+SKIP_STATUS = (204, 206, 304)
+
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        # mtime=0: el mismo cuerpo da siempre los mismos bytes
+        return gzip.compress(data, self.level, mtime=0)
+
+    def compressor(self):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self, quality):
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compressor(self):
+        compressor = brotli.Compressor(quality=self.quality)
+        return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+
+
+class Zstd:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self._context = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self._context.compress(data)
+
+    def compressor(self):
+        compressor = self._context.compressobj()
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), compressor.flush
+
+
+def load_coders():
+    available = {'gzip': lambda: Gzip(int(os.getenv('COMPRESSION_GZIP_LEVEL', 6)))}
+    if brotli is not None:
+        available['br'] = lambda: Brotli(int(os.getenv('COMPRESSION_BR_QUALITY', 4)))
+    if zstandard is not None:
+        available['zstd'] = lambda: Zstd(int(os.getenv('COMPRESSION_ZSTD_LEVEL', 3)))
+    names = [name.strip() for name in os.getenv('COMPRESSION_ALGORITHMS', 'zstd,br,gzip').split(',')]
+    return {name: available[name]() for name in names if name in available}
+
+
+coders = load_coders()
+compressed_cache = LRUCache(maxsize=int(os.getenv('COMPRESSION_CACHE_SIZE', 256)), ttl=300)
+
+
+def compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE)
+
+
+def negotiate(accept_encoding):
+    # La codificación con mayor q de las que tenemos; con el mismo q gana el orden del servidor
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    # Lo que el cliente nombra explícitamente manda sobre el comodín (gzip;q=0, *;q=0.5)
+    qualities = {value.lower(): quality for value, quality in parse_accept_header(accept_encoding)}
+    best, best_quality = None, 0
+    for name, coder in coders.items():
+        quality = qualities.get(name, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = coder, quality
+    return best
+
+
+def encode(accept_encoding, body, mimetype, etag=None, scope=None):
+    # Devuelve (codificación o None, cuerpo). Con ETag el resultado se guarda ya comprimido
+    if len(body) < MIN_SIZE or not compressible(mimetype):
+        return None, body
+    coder = negotiate(accept_encoding)
+    if coder is None:
+        return None, body
+    if etag is None:
+        return coder.name, coder.compress(body)
+    key = (scope, etag, coder.name)
+    data = compressed_cache.get(key)
+    if data is None:
+        data = coder.compress(body)
+        compressed_cache.set(key, data)
+    return coder.name, data
+
+
+def encode_stream(coder, chunks):
+    # Cada bloque se comprime y se vacía (flush) enseguida para que el cliente lo reciba ya
+    compress, finish = coder.compressor()
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def weak_validator(if_none_match, etag):
+    # En un 304 se devuelve el ETag tal como lo tiene el cliente: débil si lo guardó de una
+    # respuesta comprimida (W/"..."), fuerte si no. El 304 no sabe si el cuerpo se habría comprimido
+    return not if_none_match.contains(etag) and if_none_match.is_weak(etag)
+
+
+def _not_modified_response(response):
+    # Mismas cabeceras de caché que tendría el 200: Vary y el ETag en la forma que envió el cliente
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak and weak_validator(request.if_none_match, etag):
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _compress_response(response):
+    if response.status_code == 304:
+        return _not_modified_response(response)
+    if response.status_code in SKIP_STATUS or response.direct_passthrough or not compressible(response.mimetype) \
+            or 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return response
+    response.vary.add('Accept-Encoding')
+    accept_encoding = request.headers.get('Accept-Encoding')
+
+    if response.is_streamed:
+        # No se sabe cuánto va a ocupar: se comprime siempre que el cliente lo acepte
+        coder = negotiate(accept_encoding)
+        if coder is not None:
+            original = response.response
+            chunks = response.iter_encoded()
+            if hasattr(original, 'close'):
+                response.call_on_close(original.close)
+            response.response = encode_stream(coder, chunks)
+            response.headers['Content-Encoding'] = coder.name
+            response.headers.pop('Content-Length', None)
+        return response
+
+    etag, weak = response.get_etag()
+    coding, body = encode(accept_encoding, response.get_data(), response.mimetype,
+                          etag if etag and not weak else None, request.endpoint)
+    if coding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = coding
+        if etag:
+            response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    # Se registra antes que el resto de after_request para ejecutarse el último, con el ETag
+    # y el 304 ya resueltos sobre el cuerpo sin comprimir
+    if COMPRESSION_ENABLED:
+        app.after_request(_compress_response)
@@ -0,0 +1,205 @@
+"""
+Escritura de favoritos: alta individual con INSERT ... ON CONFLICT DO NOTHING, bajas con un
+DELETE de core que solo cuenta lo que ha borrado y altas/bajas por lotes para
+POST /user/<user_id>/favourites/batch
+Un favorito se referencia con uno de {"character_id": 1}, {"planet_id": 2} o {"starship_id": 3}
+"""
+from sqlalchemy import select, or_
+from sqlalchemy.exc import IntegrityError
+from utils import APIException, dialect_insert
+from cache import invalidate_tables, pending_changes
+from popularity import apply_counts, record_change, TARGET_TYPES
+from versions import bump
+from models import db, Favourites, Characters, Planets, Starships
+
+FAVOURITE_TARGETS = {
+    'character_id': Characters,
+    'planet_id': Planets,
+    'starship_id': Starships
+}
+
+
+def parse_reference(item):
+    # Devuelve (columna, id) o lanza ValueError con el motivo
+    if not isinstance(item, dict):
+        raise ValueError('Cada favorito debe ser un objeto')
+    references = [(column, item.get(column)) for column in FAVOURITE_TARGETS if item.get(column) is not None]
+    if len(references) != 1:
+        raise ValueError('Cada favorito debe tener uno y solo uno de character_id, planet_id o starship_id')
+    column, target_id = references[0]
+    if not isinstance(target_id, int) or isinstance(target_id, bool):
+        raise ValueError(f'{column} debe ser un número entero')
+    return column, target_id
+
+
+def insert_favourite(user_id, column, target_id):
+    # Un solo INSERT que no hace nada si el favorito ya existe (lo decide la restricción única,
+    # así dos workers a la vez no pueden duplicarlo). Devuelve el id nuevo o None si ya existía.
+    table = Favourites.__table__
+    values = {'user_id': user_id, column: target_id}
+    dialect = db.engine.dialect.name
+
+    # Sin ON CONFLICT (otras bases de datos) el duplicado salta como IntegrityError, igual que
+    # en Postgres un id que no existe en el catálogo: 409 como en los lotes, no un 500
+    try:
+        if dialect == 'postgresql':
+            stmt = dialect_insert(dialect)(table).values(values).on_conflict_do_nothing().returning(table.c.id)
+            favourite_id = db.session.execute(stmt).scalar()
+        else:
+            if dialect == 'sqlite':
+                stmt = dialect_insert(dialect)(table).values(values).on_conflict_do_nothing()
+            elif dialect == 'mysql':
+                stmt = table.insert().values(values).prefix_with('IGNORE')
+            else:
+                stmt = table.insert().values(values)
+            # Sin RETURNING: si no se ha insertado ninguna fila es que ya existía
+            result = db.session.execute(stmt)
+            favourite_id = result.inserted_primary_key[0] if result.rowcount else None
+    except IntegrityError:
+        db.session.rollback()
+        raise APIException('Este elemento ya está en tus favoritos o no existe', 409)
+
+    # Un INSERT de core no pasa por los eventos del mapper: el contador del ranking a mano
+    if favourite_id is not None:
+        record_change(db.session, db.session.connection(), TARGET_TYPES[column], target_id, 1)
+        bump(db.session.connection(), [f'favourites.{user_id}'])
+    db.session.commit()
+    if favourite_id is not None:
+        invalidate_tables(['favourites'])
+    return favourite_id
+
+
+def remove_favourites(favourites):
+    # DELETE de core que solo resta del ranking las filas que ha borrado de verdad: si otra
+    # petición ha borrado el mismo favorito a la vez no se descuenta dos veces.
+    # No hace commit; devuelve los ids borrados.
+    table = Favourites.__table__
+    columns = [table.c[column] for column in TARGET_TYPES]
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        stmt = table.delete().where(table.c.id.in_([favourite.id for favourite in favourites]))
+        rows = connection.execute(stmt.returning(table.c.id, *columns)).all()
+    else:
+        # Sin RETURNING: un DELETE por favorito y su rowcount dice si se ha borrado. SQLite puede
+        # reutilizar el id de una fila borrada, así que se compara la fila entera que se cargó.
+        rows = []
+        for favourite in favourites:
+            values = [getattr(favourite, column) for column in TARGET_TYPES]
+            where = [table.c.id == favourite.id, table.c.user_id == favourite.user_id]
+            where += [column == value if value is not None else column.is_(None) for column, value in zip(columns, values)]
+            if connection.execute(table.delete().where(*where)).rowcount:
+                rows.append((favourite.id, *values))
+
+    deltas = {}
+    for favourite_id, *targets in rows:
+        for column, target_id in zip(TARGET_TYPES, targets):
+            if target_id is not None:
+                key = (TARGET_TYPES[column], target_id)
+                deltas[key] = deltas.get(key, 0) - 1
+    apply_counts(db.session, connection, deltas)
+    if rows:
+        # Como el flush del ORM: versión de los favoritos del usuario y caché al hacer commit
+        bump(connection, {f'favourites.{favourite.user_id}' for favourite in favourites})
+        pending_changes(db.session, 'changed_tables').append('favourites')
+    # Los objetos ya no existen: fuera de la sesión para que el flush no intente borrarlos otra vez
+    for favourite in favourites:
+        db.session.expunge(favourite)
+    return [row[0] for row in rows]
+
+
+def parse_items(items, results, action):
+    references = {}
+    for index, item in enumerate(items):
+        try:
+            references[index] = parse_reference(item)
+        except ValueError as error:
+            results.append({'index': index, 'action': action, 'status': 'invalid', 'error': str(error)})
+    return references
+
+
+def references_filter(references):
+    # WHERE character_id IN (...) OR planet_id IN (...) OR starship_id IN (...)
+    by_column = {}
+    for column, target_id in references:
+        by_column.setdefault(column, set()).add(target_id)
+    return or_(*[getattr(Favourites, column).in_(ids) for column, ids in by_column.items()])
+
+
+def reference_of(favourite):
+    for column in FAVOURITE_TARGETS:
+        if getattr(favourite, column) is not None:
+            return column, getattr(favourite, column)
+
+
+def batch_update(user_id, add, remove):
+    # Todo en una transacción: una consulta por catálogo para validar los ids, una para los
+    # duplicados, una para los que hay que borrar y un único commit.
+    results = []
+    to_add = parse_items(add, results, 'add')
+    to_remove = parse_items(remove, results, 'remove')
+
+    # Ids que existen en cada catálogo
+    wanted = {}
+    for column, target_id in to_add.values():
+        wanted.setdefault(column, set()).add(target_id)
+    existing_targets = set()
+    for column, ids in wanted.items():
+        model = FAVOURITE_TARGETS[column]
+        found = db.session.execute(select(model.id).where(model.id.in_(ids))).scalars()
+        existing_targets.update((column, target_id) for target_id in found)
+
+    # Favoritos que el usuario ya tiene, tanto para no duplicar como para borrar
+    current = {}
+    references = set(to_add.values()) | set(to_remove.values())
+    if references:
+        favourites = Favourites.query.filter(
+            Favourites.user_id == user_id, references_filter(references)
+        ).all()
+        current = {reference_of(favourite): favourite for favourite in favourites}
+
+    removed = {}
+    for reference in to_remove.values():
+        if reference in current:
+            removed[reference] = current[reference]
+    # Los borrados van antes que las altas, por si el lote quita y vuelve a añadir el mismo.
+    # Lo que otra petición ya había borrado cuenta como no encontrado.
+    deleted = set(remove_favourites(list(removed.values()))) if removed else set()
+    for index, reference in to_remove.items():
+        favourite = removed.get(reference)
+        if favourite is None or favourite.id not in deleted:
+            results.append({'index': index, 'action': 'remove', 'status': 'not_found',
+                            'error': 'No está en tus favoritos'})
+            continue
+        results.append({'index': index, 'action': 'remove', 'status': 'removed', 'favourite_id': favourite.id})
+
+    created = {}
+    for index, reference in to_add.items():
+        if reference not in existing_targets:
+            results.append({'index': index, 'action': 'add', 'status': 'not_found',
+                            'error': f'No existe {reference[0]} {reference[1]}'})
+        elif reference in current and reference not in removed:
+            results.append({'index': index, 'action': 'add', 'status': 'duplicate',
+                            'favourite_id': current[reference].id})
+        else:
+            status = 'duplicate' if reference in created else 'created'
+            if reference not in created:
+                created[reference] = Favourites(user_id=user_id, **{reference[0]: reference[1]})
+                db.session.add(created[reference])
+            results.append({'index': index, 'action': 'add', 'status': status, 'favourite': created[reference]})
+
+    # El flush asigna los ids de los nuevos favoritos; los leemos antes del commit porque
+    # después los objetos caducan y cada .id sería otra consulta.
+    # Si otra petición ha metido el mismo favorito a la vez salta la restricción única.
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise APIException('Tus favoritos han cambiado mientras tanto, vuelve a intentarlo', 409)
+    for result in results:
+        if 'favourite' in result:
+            result['favourite_id'] = result.pop('favourite').id
+    db.session.commit()
+
+    results.sort(key=lambda result: (result['action'] != 'remove', result['index']))
+    return results
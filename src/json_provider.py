@@ -0,0 +1,75 @@
+"""
+Proveedor JSON de la app. Con orjson instalado las respuestas se serializan con orjson
+(bastante más rápido que el json de la stdlib con listas grandes); si no, se usa el de Flask.
+
+    JSON_PROVIDER=auto (por defecto), orjson o stdlib
+"""
+import os
+from flask.json.provider import DefaultJSONProvider
+from records import Record
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    # Los registros del catálogo (records.py) como objetos; el resto como en Flask
+    if isinstance(o, Record):
+        return o.as_dict()
+    return DefaultJSONProvider.default(o)
+
+
+class StdlibProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(StdlibProvider):
+    # Mismo comportamiento que el proveedor de Flask: claves ordenadas, compacto salvo en debug,
+    # y fechas, Decimal, UUID y dataclasses (también los registros) convertidos con el mismo default()
+    def options(self, indent=None):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # orjson ya es compacto y siempre UTF-8, el resto de argumentos de json.dumps no aplican
+        return orjson.dumps(obj, default=self.default, option=self.options(kwargs.get('indent'))).decode()
+
+    def dumps_bytes(self, obj, indent=None):
+        # Sin pasar por str: es lo que va directamente al cuerpo de la respuesta
+        return orjson.dumps(obj, default=self.default, option=self.options(indent))
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    'stdlib': StdlibProvider,
+    'orjson': OrjsonProvider
+}
+
+
+def json_provider_class(name=None):
+    name = (name or os.getenv('JSON_PROVIDER', 'auto')).lower()
+    if name == 'auto':
+        name = 'orjson' if orjson else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson pero orjson no está instalado')
+    if name not in PROVIDERS:
+        raise RuntimeError(f'JSON_PROVIDER desconocido: {name}')
+    return PROVIDERS[name]
+
+
+def init_json(app, name=None):
+    app.json_provider_class = json_provider_class(name)
+    app.json = app.json_provider_class(app)
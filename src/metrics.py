@@ -0,0 +1,201 @@
+"""
+Métricas por petición: latencia por ruta, número de consultas y tiempo en la base de datos,
+y tiempo de serialización JSON. Se publican en formato Prometheus en /metrics
+(METRICS_ENABLED=1) y opcionalmente en la cabecera Server-Timing (SERVER_TIMING=1).
+Con las dos variables apagadas no se registra ningún hook y el coste es cero.
+Cada worker de gunicorn tiene sus propios contadores.
+"""
+import os
+import threading
+import time
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from cache import catalog_cache
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED') == '1'
+SERVER_TIMING = os.getenv('SERVER_TIMING') == '1'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._help = {}
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help, buckets):
+        self._help[name] = (help, buckets)
+
+    def gauge(self, collect):
+        # collect() devuelve una lista de (nombre, etiquetas, valor) en el momento del scrape
+        self._gauges.append(collect)
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._help[name][1])
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help, _) in self._help.items():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels, le=bound)} {cumulative}')
+                    lines.append(f'{name}_bucket{format_labels(labels, le="+Inf")} {histogram.count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        for collect in self._gauges:
+            for name, labels, value in collect():
+                lines.append(f'{name}{format_labels(tuple(sorted(labels.items())))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+registry = Registry()
+registry.histogram('http_request_duration_seconds', 'Latencia de las peticiones por ruta', LATENCY_BUCKETS)
+registry.histogram('db_queries_per_request', 'Consultas SQL por petición', QUERY_BUCKETS)
+registry.histogram('db_time_seconds', 'Tiempo en la base de datos por petición', LATENCY_BUCKETS)
+registry.histogram('serialization_seconds', 'Tiempo serializando JSON por petición', LATENCY_BUCKETS)
+
+
+def cache_gauges():
+    stats = catalog_cache.stats()
+    return [(f'catalog_cache_{name}', {}, stats[name]) for name in ('size', 'maxsize', 'hits', 'misses', 'evictions')]
+
+
+registry.gauge(cache_gauges)
+
+
+def _add_serialize_time(start):
+    timings = g.get('timings') if has_request_context() else None
+    if timings is not None:
+        timings['serialize'] += time.perf_counter() - start
+
+
+class TimedJSONMixin:
+    # Se monta encima del proveedor JSON que use la app y suma el tiempo de dumps() a la petición
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _add_serialize_time(start)
+
+    def dumps_bytes(self, obj, indent=None):
+        start = time.perf_counter()
+        try:
+            return super().dumps_bytes(obj, indent)
+        finally:
+            _add_serialize_time(start)
+
+
+def timed_provider(provider_class):
+    return type('Timed' + provider_class.__name__, (TimedJSONMixin, provider_class), {})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    timings = g.get('timings') if has_request_context() else None
+    if timings is not None:
+        timings['db_count'] += 1
+        timings['db'] += elapsed
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _stop_query_timer(conn)
+
+
+def _handle_error(context):
+    # Una consulta que falla no llega a after_cursor_execute: sin esto su inicio se queda para
+    # siempre en la pila de la conexión (que vuelve al pool) y su tiempo no cuenta en la petición
+    conn = context.connection
+    if conn is not None and context.execution_context is not None and conn.info.get('query_start'):
+        _stop_query_timer(conn)
+
+
+def _start_timer():
+    g.timings = {'start': time.perf_counter(), 'db_count': 0, 'db': 0.0, 'serialize': 0.0}
+
+
+def _record(response):
+    timings = g.pop('timings', None)
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings['start']
+
+    if METRICS_ENABLED:
+        # La plantilla de la ruta (/user/<int:id>) y no la URL, para no crear una serie por id
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = {'route': route, 'method': request.method}
+        registry.observe('http_request_duration_seconds', dict(labels, status=response.status_code), total)
+        registry.observe('db_queries_per_request', labels, timings['db_count'])
+        registry.observe('db_time_seconds', labels, timings['db'])
+        registry.observe('serialization_seconds', labels, timings['serialize'])
+
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = (
+            f'db;desc="{timings["db_count"]} queries";dur={timings["db"] * 1000:.2f}, '
+            f'serialize;dur={timings["serialize"] * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+    return response
+
+
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    if not (METRICS_ENABLED or SERVER_TIMING):
+        return
+
+    app.json_provider_class = timed_provider(type(app.json))
+    app.json = app.json_provider_class(app)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    app.before_request(_start_timer)
+    app.after_request(_record)
+
+    if METRICS_ENABLED:
+        app.add_url_rule('/metrics', 'metrics', metrics)
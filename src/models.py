@@ -6,7 +6,8 @@ class User(db.Model):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(80), unique=False, nullable=False)
+    # Hash scrypt con sus parámetros (ver passwords.py), nunca la contraseña en claro
+    password = db.Column(db.String(255), unique=False, nullable=False)
     is_active = db.Column(db.Boolean, unique=False, nullable=False)
 
 #realizo la relacion con información cruzada
@@ -23,11 +24,51 @@ class User(db.Model):
             # do not serialize the password, it's a security breach
         }
 
+    @classmethod
+    def profile(cls, user_id, expand=()):
+        # Usuario, favoritos y elementos del catálogo con un número fijo de consultas (5 como mucho):
+        # selectinload hace un SELECT ... WHERE id IN (...) por relación en vez de uno por favorito.
+        # De las relaciones que no se expanden solo se carga el nombre.
+        loaders = []
+        for name in Favourites.EXPANDABLE:
+            relationship = getattr(Favourites, name)
+            loader = db.selectinload(relationship)
+            if name not in expand:
+                loader = loader.load_only(relationship.property.mapper.class_.name)
+            loaders.append(loader)
+        stmt = db.select(cls).where(cls.id == user_id).options(db.selectinload(cls.favourite).options(*loaders))
+        user = db.session.execute(stmt).scalar_one_or_none()
+        if user is None:
+            return None
+
+        favourites = []
+        for favourite in sorted(user.favourite, key=lambda favourite: favourite.id):
+            item = favourite.serialize()
+            for name in expand:
+                target = getattr(favourite, name)
+                item[name] = target.serialize() if target else None
+            favourites.append(item)
+        return {**user.serialize(), 'favourites': favourites}
+
 class Favourites(db.Model):
     __tablename__ = 'favourites'
+    # Un usuario no puede tener dos veces el mismo personaje, planeta o nave.
+    # Los NULL no cuentan como iguales, así que cada restricción solo afecta a su tipo.
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'character_id', name='uq_favourites_user_character'),
+        db.UniqueConstraint('user_id', 'planet_id', name='uq_favourites_user_planet'),
+        db.UniqueConstraint('user_id', 'starship_id', name='uq_favourites_user_starship'),
+        # Cada favorito apunta exactamente a un personaje, un planeta o una nave
+        db.CheckConstraint(
+            '(CASE WHEN character_id IS NULL THEN 0 ELSE 1 END'
+            ' + CASE WHEN planet_id IS NULL THEN 0 ELSE 1 END'
+            ' + CASE WHEN starship_id IS NULL THEN 0 ELSE 1 END) = 1',
+            name='ck_favourites_one_target'
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     character_id = db.Column(db.Integer, db.ForeignKey('characters.id'))
     planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
     starship_id = db.Column(db.Integer, db.ForeignKey('starships.id'))
@@ -40,7 +81,9 @@ class Favourites(db.Model):
     planet = db.relationship('Planets')
     starship=db.relationship('Starships')
 
-   
+    # Relaciones que /user/<id>/profile?expand=... puede devolver completas
+    EXPANDABLE = ('character', 'planet', 'starship')
+
 
     def serialize(self):
         return {
@@ -52,9 +95,46 @@ class Favourites(db.Model):
            
         }
 
+    @classmethod
+    def serialize_for_user(cls, user_id, favourite_id=None):
+        # serialize() carga character, planet y starship por separado (hasta 3 SELECT por favorito).
+        # Aquí sacamos solo los nombres con LEFT JOIN en una única consulta.
+        stmt = cls.serialized_select(user_id, favourite_id)
+        return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+    @classmethod
+    def serialized_select(cls, user_id, favourite_id=None):
+        stmt = (
+            db.select(
+                cls.id,
+                cls.user_id,
+                Characters.name.label('character_name'),
+                Planets.name.label('planet_name'),
+                Starships.name.label('starship_name')
+            )
+            .outerjoin(Characters, cls.character_id == Characters.id)
+            .outerjoin(Planets, cls.planet_id == Planets.id)
+            .outerjoin(Starships, cls.starship_id == Starships.id)
+            .where(cls.user_id == user_id)
+            .order_by(cls.id)
+        )
+        if favourite_id is not None:
+            stmt = stmt.where(cls.id == favourite_id)
+        return stmt
+
 class Characters(db.Model):
     __tablename__ = 'characters'
 
+    # Columnas por las que se puede filtrar y ordenar en /characters (todas tienen índice)
+    FILTERABLE = ('gender', 'height', 'mass')
+    SORTABLE = ('name', 'height', 'mass')
+    # Índices (columna, id) para el orden y el cursor de la paginación (ver catalog.build_selects)
+    __table_args__ = (
+        db.Index('ix_characters_name_id', 'name', 'id'),
+        db.Index('ix_characters_height_id', 'height', 'id'),
+        db.Index('ix_characters_mass_id', 'mass', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name= db.Column(db.String(250), nullable=False)
     height = db.Column(db.Integer)
@@ -62,7 +142,7 @@ class Characters(db.Model):
     hair_color = db.Column(db.String(50))
     skin_color = db.Column(db.String(50))
     birth_year = db.Column(db.String(10))
-    gender = db.Column(db.Enum('male', 'female', 'others', name='gender'))
+    gender = db.Column(db.Enum('male', 'female', 'others', name='gender'), index=True)
 
     
 
@@ -84,6 +164,16 @@ class Characters(db.Model):
 class Planets(db.Model):
     __tablename__ = 'planets'
 
+    # Columnas por las que se puede filtrar y ordenar en /planets (todas tienen índice)
+    FILTERABLE = ('climate', 'terrain', 'population', 'diameter')
+    SORTABLE = ('name', 'population', 'diameter')
+    # Índices (columna, id) para el orden y el cursor de la paginación (ver catalog.build_selects)
+    __table_args__ = (
+        db.Index('ix_planets_name_id', 'name', 'id'),
+        db.Index('ix_planets_population_id', 'population', 'id'),
+        db.Index('ix_planets_diameter_id', 'diameter', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False)
     diameter = db.Column(db.Integer)
@@ -91,8 +181,8 @@ class Planets(db.Model):
     orbital_period = db.Column(db.Integer)
     gravity = db.Column(db.String(50))
     population = db.Column(db.Integer)
-    climate = db.Column(db.String(50))
-    terrain = db.Column(db.String(50))
+    climate = db.Column(db.String(50), index=True)
+    terrain = db.Column(db.String(50), index=True)
 
    
 
@@ -115,11 +205,21 @@ class Planets(db.Model):
 class Starships(db.Model):
     __tablename__='starships'
 
+    # Columnas por las que se puede filtrar y ordenar en /starships (todas tienen índice)
+    FILTERABLE = ('starship_class', 'manufacturer', 'cost_in_credits', 'crew')
+    SORTABLE = ('name', 'cost_in_credits', 'crew')
+    # Índices (columna, id) para el orden y el cursor de la paginación (ver catalog.build_selects)
+    __table_args__ = (
+        db.Index('ix_starships_name_id', 'name', 'id'),
+        db.Index('ix_starships_cost_in_credits_id', 'cost_in_credits', 'id'),
+        db.Index('ix_starships_crew_id', 'crew', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False)
     model = db.Column(db.String(150))
-    starship_class = db.Column(db.String(150))
-    manufacturer = db.Column(db.String(150))
+    starship_class = db.Column(db.String(150), index=True)
+    manufacturer = db.Column(db.String(150), index=True)
     cost_in_credits = db.Column(db.Integer)
     length = db.Column(db.Integer)
     crew = db.Column(db.Integer)
@@ -148,6 +248,36 @@ class Starships(db.Model):
         }
 
 
+class CatalogStat(db.Model):
+    __tablename__ = 'catalog_stats'
+    # Contadores de /stats ('planets.count', 'characters.gender.male'...), los mantiene stats.py
+    name = db.Column(db.String(120), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CatalogStat {self.name}={self.value}>'
+
+
+class FavouriteCount(db.Model):
+    __tablename__ = 'favourite_counts'
+    # Veces que cada personaje, planeta o nave está en favoritos, la mantiene popularity.py.
+    # El índice sirve el ranking por tipo sin ordenar la tabla entera.
+    __table_args__ = (
+        db.Index('ix_favourite_counts_ranking', 'target_type', 'value'),
+    )
+    target_type = db.Column(db.String(20), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<FavouriteCount {self.target_type} {self.target_id}={self.value}>'
 
 
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+    # Versiones de los datos para los ETag de las rutas de usuario, las mantiene versions.py
+    name = db.Column(db.String(120), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
 
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.value}>'
@@ -0,0 +1,118 @@
+"""
+Hash de contraseñas con scrypt (hashlib, sin dependencias) y coste configurable:
+
+    PASSWORD_SCRYPT_N=16384, PASSWORD_SCRYPT_R=8, PASSWORD_SCRYPT_P=1
+
+El hash guarda sus parámetros (scrypt$n$r$p$sal$hash), así que al subir el coste los hashes
+antiguos siguen valiendo y se rehacen al iniciar sesión. Las contraseñas en texto plano
+anteriores a este cambio también se aceptan una vez y se sustituyen por su hash.
+
+El cálculo se hace en un pool de PASSWORD_HASH_WORKERS hilos por proceso (scrypt suelta el GIL)
+con como mucho PASSWORD_HASH_QUEUE peticiones esperando; si se llena se rechaza con 503 en vez
+de dejar a las lecturas sin CPU durante una avalancha de altas o logins.
+
+El límite es por proceso, así que solo sirve si el proceso atiende varias peticiones a la vez:
+los workers gthread del Procfile (GUNICORN_THREADS hilos) o el modo asgi. Con workers síncronos
+cada proceso tiene una sola petición en curso, nunca se llega a HashingBusy y una avalancha de
+logins ocupa todos los workers. Con los valores por defecto (2 + 2 de 8 hilos) la mitad de los
+hilos de cada worker siguen libres para el resto de rutas.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', HASH_WORKERS))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+PREFIX = 'scrypt'
+
+_executor = ThreadPoolExecutor(HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    # maxmem: lo que pide OpenSSL para estos parámetros (128 * r * (n + p + 2)) más margen
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES,
+                          maxmem=128 * r * (n + p + 2) + 1024 * 1024)
+
+
+def _hash(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+
+
+def _parse(stored):
+    # None si no es un hash nuestro bien formado: se compara como contraseña en texto plano
+    parts = stored.split('$')
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return None
+    try:
+        n, r, p = (int(value) for value in parts[1:4])
+        salt, key = base64.b64decode(parts[4], validate=True), base64.b64decode(parts[5], validate=True)
+    except (ValueError, binascii.Error):
+        return None
+    # Parámetros que hashlib.scrypt rechazaría (n potencia de 2 mayor que 1)
+    if n < 2 or n & (n - 1) or r < 1 or p < 1:
+        return None
+    return n, r, p, salt, key
+
+
+# Hash de una contraseña cualquiera para que un email que no existe tarde lo mismo en responder
+_DUMMY = None
+
+
+def _verify(stored, password):
+    # Devuelve (correcta, hay_que_rehacer_el_hash)
+    global _DUMMY
+    if stored is None:
+        if _DUMMY is None:
+            _DUMMY = _hash(secrets.token_hex(8))
+        _verify(_DUMMY, password)
+        return False, False
+
+    parsed = _parse(stored)
+    if parsed is None:
+        # Contraseña antigua guardada en texto plano
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+
+    n, r, p, salt, key = parsed
+    valid = hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+    return valid, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def _run(function, *args):
+    # Espera el resultado en el pool acotado; si ya hay demasiadas en cola, HashingBusy
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return _executor.submit(function, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    return _run(_hash, password)
+
+
+def verify_password(stored, password):
+    # stored=None para un usuario que no existe (tarda lo mismo y devuelve False)
+    return _run(_verify, stored, password)
@@ -0,0 +1,101 @@
+"""
+Configuración del pool de conexiones a partir de variables de entorno.
+
+Cada worker de gunicorn tiene su propio pool. Con los workers gthread del Procfile un worker
+atiende GUNICORN_THREADS peticiones a la vez, así que por defecto el pool es de GUNICORN_THREADS
+conexiones y otras tantas de desborde.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT (s), DB_POOL_RECYCLE (s), DB_POOL_PRE_PING (1/0)
+    DB_PGBOUNCER=1  sin pool propio (NullPool) y sin sentencias preparadas en el servidor
+"""
+import os
+import threading
+import time
+import weakref
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, NullPool
+from metrics import registry, LATENCY_BUCKETS, METRICS_ENABLED
+
+registry.histogram('db_pool_checkout_wait_seconds', 'Espera para conseguir una conexión del pool', LATENCY_BUCKETS)
+
+_pools = weakref.WeakSet()
+_timeouts = [0]
+_timeouts_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool que mide cuánto espera cada petición por una conexión libre
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools.add(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with _timeouts_lock:
+                _timeouts[0] += 1
+            raise
+        finally:
+            if METRICS_ENABLED:
+                registry.observe('db_pool_checkout_wait_seconds', {}, time.perf_counter() - start)
+
+
+def env_flag(name, default):
+    return os.getenv(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+
+def engine_options(database_url):
+    # SQLite usa el pool que elige SQLAlchemy (no admite tamaños de pool)
+    if database_url.startswith('sqlite'):
+        return {}
+
+    options = {
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
+
+    if env_flag('DB_PGBOUNCER', False):
+        # PgBouncer en modo transacción ya hace de pool y no soporta sentencias preparadas
+        options['poolclass'] = NullPool
+        options.pop('pool_recycle')
+        if database_url.startswith('postgresql+psycopg:'):
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    threads = int(os.getenv('GUNICORN_THREADS', 8))
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', threads)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', threads)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10))
+    })
+    return options
+
+
+def pool_status():
+    pools = list(_pools)
+    return {
+        'size': sum(pool.size() for pool in pools),
+        'checked_out': sum(pool.checkedout() for pool in pools),
+        'overflow': sum(max(pool.overflow(), 0) for pool in pools),
+        'timeouts': _timeouts[0]
+    }
+
+
+def pool_gauges():
+    if not _pools:
+        return []
+    status = pool_status()
+    capacity = sum(pool.size() + pool._max_overflow for pool in _pools)
+    return [
+        ('db_pool_size', {}, status['size']),
+        ('db_pool_checked_out', {}, status['checked_out']),
+        ('db_pool_overflow', {}, status['overflow']),
+        ('db_pool_timeouts_total', {}, status['timeouts']),
+        ('db_pool_saturation', {}, round(status['checked_out'] / capacity, 3) if capacity else 0)
+    ]
+
+
+registry.gauge(pool_gauges)
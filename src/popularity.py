@@ -0,0 +1,217 @@
+"""
+Ranking de personajes, planetas y naves más añadidos a favoritos (GET /top y /stats).
+
+favourite_counts guarda cuántas veces está cada elemento en favoritos y se actualiza en la
+misma transacción que cada alta o baja: los eventos del mapper de Favourites apuntan los cambios
+y al final de cada flush se suman todos con una sentencia (insert_favourite y remove_favourites
+lo hacen a mano). Las bajas solo restan las filas que se han borrado de verdad.
+Encima, cada proceso tiene un top-K en memoria por tipo (TOP_K_SIZE elementos) que se carga con
+una consulta sobre el índice (target_type, value) y se actualiza con los commits de este
+proceso. Los de otros workers se ven al recargarlo, como mucho cada TOP_TTL segundos.
+"""
+import os
+import threading
+import time
+from sqlalchemy import event, select, tuple_
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+from models import db, FavouriteCount, Favourites, Characters, Planets, Starships
+from utils import increment_counters, locked_values
+from cache import on_commit, pending_changes, flush_changes
+
+TOP_K_SIZE = int(os.getenv('TOP_K_SIZE', 100))
+TOP_TTL = float(os.getenv('TOP_TTL', 30))
+
+TARGETS = {
+    'characters': ('character_id', Characters),
+    'planets': ('planet_id', Planets),
+    'starships': ('starship_id', Starships)
+}
+TARGET_TYPES = {column: target_type for target_type, (column, _) in TARGETS.items()}
+
+
+class TopK:
+    # Los size elementos con más favoritos. outside_max es una cota del contador de cualquier
+    # elemento que no está en la lista: si uno de dentro baja por debajo ya no sabemos quién
+    # le adelanta y se recarga desde la base de datos.
+    def __init__(self, size):
+        self.size = size
+        self.counts = {}
+        self.names = {}
+        self.outside_max = 0
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > TOP_TTL
+
+    def load(self, rows):
+        with self._lock:
+            self.counts = {item_id: count for item_id, _, count in rows}
+            self.names = {item_id: name for item_id, name, _ in rows}
+            self.outside_max = rows[-1][2] if len(rows) >= self.size else 0
+            self.loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded_at = None
+
+    def update(self, item_id, count):
+        with self._lock:
+            if self.loaded_at is None:
+                return
+            if item_id in self.counts:
+                if count < self.outside_max:
+                    self.loaded_at = None
+                elif count <= 0:
+                    del self.counts[item_id]
+                else:
+                    self.counts[item_id] = count
+            elif count > 0:
+                if len(self.counts) < self.size:
+                    self.counts[item_id] = count
+                    return
+                last = min(self.counts, key=lambda key: (self.counts[key], -key))
+                if count > self.counts[last]:
+                    self.outside_max = max(self.outside_max, self.counts.pop(last))
+                    self.names.pop(last, None)
+                    self.counts[item_id] = count
+                else:
+                    self.outside_max = max(self.outside_max, count)
+
+    def top(self, limit):
+        with self._lock:
+            items = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return items, dict(self.names)
+
+    def remember_names(self, names):
+        with self._lock:
+            self.names.update(names)
+
+
+tops = {target_type: TopK(TOP_K_SIZE) for target_type in TARGETS}
+
+
+def apply_counts(session, connection, deltas):
+    # Suma los deltas {(tipo, id): delta} a favourite_counts con una sola llamada a
+    # increment_counters, lee los valores nuevos con un solo SELECT ... IN y los apunta para
+    # pasarlos al top-K en memoria cuando se haga commit
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = FavouriteCount.__table__
+    increment_counters(connection, table, ['target_type', 'target_id'],
+                       [{'target_type': target_type, 'target_id': target_id, 'value': delta}
+                        for (target_type, target_id), delta in deltas.items()])
+    rows = connection.execute(
+        select(table.c.target_type, table.c.target_id, table.c.value)
+        .where(tuple_(table.c.target_type, table.c.target_id).in_(list(deltas)))
+    )
+    pending_changes(session, 'favourite_counts').extend(tuple(row) for row in rows)
+
+
+def record_change(session, connection, target_type, target_id, delta):
+    # Para los INSERT de core, que no pasan por los eventos del mapper (ver insert_favourite)
+    apply_counts(session, connection, {(target_type, target_id): delta})
+
+
+def _targets(values):
+    return [(TARGET_TYPES[column], target_id) for column, target_id in values.items() if target_id is not None]
+
+
+def _current(target):
+    return {column: getattr(target, column) for column in TARGET_TYPES}
+
+
+def _add_deltas(target, values, sign):
+    # Los eventos solo apuntan; los contadores se actualizan una vez por flush (_apply_deltas)
+    deltas = flush_changes(object_session(target), 'favourite_deltas')
+    for key in _targets(values):
+        deltas[key] = deltas.get(key, 0) + sign
+
+
+@event.listens_for(Favourites, 'after_insert')
+def _count_insert(mapper, connection, target):
+    _add_deltas(target, _current(target), 1)
+
+
+@event.listens_for(Favourites, 'before_delete')
+def _count_delete(mapper, connection, target):
+    # Borrados del ORM (el admin): si otra transacción ya lo había borrado no se resta
+    values = locked_values(connection, mapper, target, TARGET_TYPES)
+    if values:
+        _add_deltas(target, values, -1)
+
+
+@event.listens_for(Favourites, 'after_update')
+def _count_update(mapper, connection, target):
+    # Un favorito editado desde el admin puede cambiar de destino
+    old, new = {}, {}
+    for column in TARGET_TYPES:
+        history = get_history(target, column)
+        if history.has_changes():
+            old[column] = history.deleted[0] if history.deleted else None
+            new[column] = history.added[0] if history.added else None
+    _add_deltas(target, old, -1)
+    _add_deltas(target, new, 1)
+
+
+for _column in TARGET_TYPES:
+    # active_history: el ORM carga el destino anterior antes de cambiarlo, para poder restarlo
+    event.listen(getattr(Favourites, _column), 'set', lambda *args: None, active_history=True)
+
+
+def _update_tops(counts):
+    # En orden: si un elemento cambia dos veces en la transacción gana el último valor
+    for target_type, target_id, count in counts:
+        tops[target_type].update(target_id, count)
+
+
+def _apply_deltas(session, changes, pending):
+    # Al final de cada flush, en la misma transacción: todos los altas y bajas del flush juntos
+    deltas = flush_changes(session, 'favourite_deltas')
+    if deltas:
+        apply_counts(session, session.connection(), deltas)
+
+
+on_commit('favourite_counts', _apply_deltas, _update_tops)
+
+
+def top_items(target_type, limit):
+    column, model = TARGETS[target_type]
+    topk = tops[target_type]
+    if topk.stale():
+        stmt = (
+            select(FavouriteCount.target_id, model.name, FavouriteCount.value)
+            .join(model, model.id == FavouriteCount.target_id)
+            .where(FavouriteCount.target_type == target_type, FavouriteCount.value > 0)
+            .order_by(FavouriteCount.value.desc(), FavouriteCount.target_id)
+            .limit(topk.size)
+        )
+        topk.load(db.session.execute(stmt).all())
+
+    items, names = topk.top(limit)
+    # Los que han entrado en el top desde la última carga todavía no tienen nombre
+    missing = [item_id for item_id, _ in items if item_id not in names]
+    if missing:
+        found = dict(db.session.execute(select(model.id, model.name).where(model.id.in_(missing))).all())
+        topk.remember_names(found)
+        names.update(found)
+    return [{'id': item_id, 'name': names.get(item_id), 'favourites': count} for item_id, count in items]
+
+
+def rebuild_counts():
+    # Recalcula favourite_counts desde favourites con GROUP BY (flask stats rebuild)
+    connection = db.session.connection()
+    connection.execute(FavouriteCount.__table__.delete())
+    for target_type, (column, _) in TARGETS.items():
+        group = getattr(Favourites, column)
+        rows = connection.execute(
+            select(group, db.func.count()).where(group.isnot(None)).group_by(group)
+        ).all()
+        if rows:
+            connection.execute(FavouriteCount.__table__.insert(), [
+                {'target_type': target_type, 'target_id': target_id, 'value': count} for target_id, count in rows
+            ])
+    for topk in tops.values():
+        topk.invalidate()
@@ -0,0 +1,225 @@
+"""
+Límite de peticiones por ruta y por cliente con ventana deslizante (sliding window counter:
+el contador de la ventana actual más el de la anterior ponderado por lo que queda de ella).
+Cada clave ocupa una lista de 3 números y las que llevan dos ventanas sin uso se borran
+periódicamente.
+
+El cliente es el usuario del token si la petición trae uno válido y si no la IP
+(X-Forwarded-For solo con RATE_LIMIT_TRUST_PROXY=1, es decir, detrás de un proxy de confianza).
+
+    RATE_LIMIT_ENABLED=1
+    RATE_LIMIT_STORAGE=memory            contadores de cada proceso
+    RATE_LIMIT_STORAGE=redis://host:6379 compartidos entre workers (necesita el paquete redis)
+    RATE_LIMIT_DEFAULT=600/minute        para las rutas sin política propia (vacío = sin límite)
+    RATE_LIMIT_<ENDPOINT>=10/minute      p. ej. RATE_LIMIT_ADD_DATAS, RATE_LIMIT_LOGIN
+
+Las respuestas llevan RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset y RateLimit-Policy,
+y las rechazadas (429) también Retry-After.
+"""
+import math
+import os
+import threading
+import time
+from flask import request, jsonify, g
+from auth import decode_token, bearer_token, AuthError
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Políticas por endpoint de Flask (nombre de la función de la ruta)
+POLICIES = {
+    'add_usser': '5/minute',
+    'login': '10/minute',
+    'refresh_token': '30/minute',
+    'add_datas': '30/minute',
+    'get_all_users': '120/minute',
+    'show_planets': '120/minute',
+    'show_starships': '120/minute',
+    'show_characters': '120/minute',
+    'search': '120/minute',
+    'stats': '120/minute',
+    'top': '120/minute'
+}
+
+EVICT_INTERVAL = 60
+
+
+class Policy:
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    @classmethod
+    def parse(cls, text):
+        # "10/minute", "100/hour" o "5/30s"
+        count, _, period = text.strip().partition('/')
+        if period.endswith('s') and period[:-1].isdigit():
+            window = int(period[:-1])
+        else:
+            window = PERIODS[period]
+        return cls(int(count), window)
+
+    def header(self):
+        return f'{self.limit};w={self.window}'
+
+
+def evaluate(previous, current, limit, window, now):
+    # Devuelve (permitida, restantes, segundos_hasta_reset, retry_after)
+    elapsed = (now % window) / window
+    estimated = previous * (1 - elapsed) + current
+    reset = math.ceil(window - now % window)
+    if estimated + 1 <= limit:
+        return True, int(limit - estimated - 1), reset, 0
+    # Cuánto hay que esperar a que el peso de la ventana anterior baje lo suficiente
+    if previous and current + 1 <= limit:
+        retry = math.ceil((estimated + 1 - limit) / previous * window)
+    else:
+        retry = reset
+    return False, 0, reset, max(retry, 1)
+
+
+class MemoryStore:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._next_eviction = time.monotonic() + EVICT_INTERVAL
+
+    def hit(self, key, limit, window, now):
+        index = int(now // window)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < index - 1:
+                entry = self._data[key] = [index, 0, 0]
+            elif entry[0] == index - 1:
+                entry[:] = [index, 0, entry[1]]
+            allowed, remaining, reset, retry = evaluate(entry[2], entry[1], limit, window, now)
+            if allowed:
+                entry[1] += 1
+            self._evict_idle(now)
+        return allowed, remaining, reset, retry
+
+    def _evict_idle(self, now):
+        # Las claves sin peticiones en dos ventanas ya no cuentan para nada
+        monotonic = time.monotonic()
+        if monotonic < self._next_eviction:
+            return
+        self._next_eviction = monotonic + EVICT_INTERVAL
+        for key in [key for key, entry in self._data.items() if entry[0] < int(now // key[2]) - 1]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Comprobar y sumar en un solo paso: Redis ejecuta el script entero sin intercalar otros
+# comandos, así dos workers a la vez no pueden ver los dos el contador por debajo del límite.
+# ARGV: peso de la ventana anterior, límite y segundos de vida del contador.
+# Devuelve {permitida, anterior, actual antes de sumar esta petición}
+HIT_SCRIPT = """
+local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current + 1 <= tonumber(ARGV[2]) then
+    redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return {1, previous, current}
+end
+return {0, previous, current}
+"""
+
+
+class RedisStore:
+    # Mismo algoritmo con un contador por ventana en Redis, compartido por todos los workers
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE apunta a Redis pero el paquete redis no está instalado')
+        self._redis = redis.Redis.from_url(url)
+        self._hit = self._redis.register_script(HIT_SCRIPT)
+
+    def hit(self, key, limit, window, now):
+        index = int(now // window)
+        name = 'ratelimit:' + ':'.join(str(part) for part in key)
+        weight = 1 - (now % window) / window
+        allowed, previous, current = self._hit(keys=[f'{name}:{index - 1}', f'{name}:{index}'],
+                                               args=[repr(weight), limit, window * 2])
+        _, remaining, reset, retry = evaluate(previous, current, limit, window, now)
+        if allowed:
+            return True, remaining, reset, 0
+        return False, 0, reset, max(retry, 1)
+
+
+def create_store(url):
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisStore(url)
+    if url == 'memory':
+        return MemoryStore()
+    raise RuntimeError(f'RATE_LIMIT_STORAGE desconocido: {url}')
+
+
+def load_policies():
+    policies = {}
+    for endpoint, default in POLICIES.items():
+        policies[endpoint] = os.getenv('RATE_LIMIT_' + endpoint.upper(), default)
+    return {endpoint: Policy.parse(text) for endpoint, text in policies.items() if text}
+
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+TRUST_PROXY = os.getenv('RATE_LIMIT_TRUST_PROXY') == '1'
+DEFAULT_POLICY = Policy.parse(os.environ['RATE_LIMIT_DEFAULT']) if os.getenv('RATE_LIMIT_DEFAULT') else None
+policies = load_policies()
+store = create_store(os.getenv('RATE_LIMIT_STORAGE', 'memory')) if RATE_LIMIT_ENABLED else None
+
+
+def client_key(headers, remote_addr):
+    # Usuario del token (solo se comprueba la firma) o IP
+    try:
+        payload, _ = decode_token(bearer_token(headers), 'access')
+        return f'user:{payload["sub"]}'
+    except AuthError:
+        pass
+    if TRUST_PROXY and headers.get('X-Forwarded-For'):
+        return 'ip:' + headers['X-Forwarded-For'].split(',')[0].strip()
+    return f'ip:{remote_addr}'
+
+
+def check(endpoint, headers, remote_addr):
+    # Devuelve None si la ruta no tiene límite, o (permitida, cabeceras)
+    policy = policies.get(endpoint, DEFAULT_POLICY)
+    if store is None or policy is None:
+        return None
+    # La ventana va en la clave para poder expulsar las claves inactivas sin guardar la política
+    key = (endpoint, client_key(headers, remote_addr), policy.window)
+    allowed, remaining, reset, retry = store.hit(key, policy.limit, policy.window, time.time())
+    response_headers = {
+        'RateLimit-Limit': str(policy.limit),
+        'RateLimit-Remaining': str(remaining),
+        'RateLimit-Reset': str(reset),
+        'RateLimit-Policy': policy.header()
+    }
+    if not allowed:
+        response_headers['Retry-After'] = str(retry)
+    return allowed, response_headers
+
+
+def _limit_request():
+    result = check(request.endpoint, request.headers, request.remote_addr)
+    if result is None:
+        return None
+    allowed, headers = result
+    g.rate_limit_headers = headers
+    if not allowed:
+        return jsonify({'msg': 'Demasiadas peticiones, inténtalo de nuevo más tarde'}), 429, headers
+
+
+def _add_headers(response):
+    headers = g.pop('rate_limit_headers', None)
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def init_rate_limits(app):
+    if store is None:
+        return
+    app.before_request(_limit_request)
+    app.after_request(_add_headers)
@@ -0,0 +1,47 @@
+"""
+Filas de solo lectura para los listados y la búsqueda del catálogo.
+
+Las consultas de lectura sacan tuplas con select() (sin objetos del ORM, ni identity map ni
+historial de atributos) y cada fila se guarda como un registro con __slots__ en vez de un dict:
+unos 110 bytes por fila más los valores, frente a unos 280 de un dict de 9 claves. Es lo que
+guardan las páginas de catalog_cache y los bloques del streaming. Los registros no se modifican
+después de crearlos.
+
+Al serializar, el proveedor JSON (json_provider.py) los convierte en objetos con as_dict(), así
+la salida (claves ordenadas) y los ETag son los mismos que con diccionarios.
+"""
+import dataclasses
+import operator
+
+
+class Record:
+    __slots__ = ()
+    _fields = ()
+
+    def as_dict(self):
+        return dict(zip(self._fields, self._values(self)))
+
+
+_types = {}
+
+
+def record_type(fields):
+    # Una clase por combinación de columnas (la proyección de ?fields= cambia las columnas)
+    fields = tuple(fields)
+    cls = _types.get(fields)
+    if cls is None:
+        cls = dataclasses.make_dataclass('CatalogRecord', fields, bases=(Record,), slots=True)
+        cls._fields = fields
+        # Con una sola columna attrgetter no devuelve una tupla
+        getter = operator.attrgetter(*fields)
+        cls._values = staticmethod(getter if len(fields) > 1 else lambda record: (getter(record),))
+        cls = _types.setdefault(fields, cls)
+    return cls
+
+
+def rows_to_records(rows):
+    # rows: resultado de un select() (filas con _fields); la clase se busca una vez por lote
+    if not rows:
+        return []
+    cls = record_type(rows[0]._fields)
+    return [cls(*row) for row in rows]
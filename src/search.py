@@ -0,0 +1,197 @@
+"""
+Búsqueda por nombre en personajes, planetas y naves para /search?q=
+En Postgres usa los índices de trigramas (pg_trgm). Con cualquier otra base de datos
+(por ejemplo el SQLite de desarrollo) usa un índice de prefijos en memoria.
+"""
+import difflib
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import select, union_all, literal, func, case, or_
+from models import db
+from catalog import CATALOG_MODELS
+from cache import table_version, on_commit
+from records import record_type
+
+SEARCH_INDEX_TTL = float(os.getenv('SEARCH_INDEX_TTL', 300))
+FUZZY_CUTOFF = 0.6
+FUZZY_CANDIDATES = int(os.getenv('SEARCH_FUZZY_CANDIDATES', 500))
+
+# Puntuación: nombre exacto > el nombre empieza por q > alguna palabra empieza por q > parecido
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+WORD_PREFIX_SCORE = 1.5
+
+# Cada resultado es un registro con __slots__ (records.py), igual que las filas de los listados
+SearchResult = record_type(('type', 'id', 'name', 'score'))
+
+
+class PrefixIndex:
+    # Lista ordenada de (clave, tipo, id, nombre). Cada nombre se indexa entero y desde el
+    # comienzo de cada palabra, así 'sky' encuentra 'Luke Skywalker'. Se busca con bisect.
+    def __init__(self):
+        self._entries = []
+        self._keys = {}
+        self._names = {}
+        self._versions = {}
+        self._built_at = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys_for(name):
+        words = name.lower().split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def _add(self, type_name, id, name):
+        keys = self.keys_for(name)
+        for key in keys:
+            insort(self._entries, (key, type_name, id, name))
+        self._keys[(type_name, id)] = keys
+        self._names[(type_name, id)] = name
+
+    def _fuzzy_candidates(self, q, found):
+        # Nombres con alguna palabra que empieza por las dos primeras letras de q: son un tramo
+        # contiguo de _entries, y con el tope de FUZZY_CANDIDATES el coste no crece con el catálogo
+        prefix = q[:2]
+        candidates = {}
+        position = bisect_left(self._entries, (prefix,))
+        end = min(position + FUZZY_CANDIDATES, len(self._entries))
+        while position < end and self._entries[position][0].startswith(prefix):
+            key, type_name, id, name = self._entries[position]
+            if (type_name, id) not in found:
+                candidates.setdefault(key, []).append((type_name, id, name))
+            position += 1
+        return candidates
+
+    def _remove(self, type_name, id):
+        name = self._names.pop((type_name, id), None)
+        for key in self._keys.pop((type_name, id), ()):
+            entry = (key, type_name, id, name)
+            position = bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def rebuild(self, type_name, model):
+        # Las entradas se generan y ordenan fuera del lock, con un solo sort(); al juntarlas con
+        # las de los otros tipos (ya ordenadas) sort() solo tiene que mezclar dos tramos
+        version = table_version(model.__tablename__)
+        rows = db.session.execute(select(model.id, model.name)).all()
+        keys = {(type_name, id): self.keys_for(name) for id, name in rows}
+        entries = [(key, type_name, id, name) for id, name in rows for key in keys[(type_name, id)]]
+        entries.sort()
+        with self._lock:
+            others = [entry for entry in self._entries if entry[1] != type_name]
+            self._entries = others + entries
+            self._entries.sort()
+            for key in [key for key in self._names if key[0] == type_name]:
+                del self._names[key]
+                del self._keys[key]
+            self._keys.update(keys)
+            self._names.update(((type_name, id), name) for id, name in rows)
+            self._versions[type_name] = version
+            self._built_at[type_name] = time.monotonic()
+
+    def apply(self, changes):
+        # changes: lista de (tipo, id, nombre o None si se ha borrado) de un commit
+        with self._lock:
+            for type_name, id, name in changes:
+                self._remove(type_name, id)
+                if name is not None:
+                    self._add(type_name, id, name)
+            for type_name in {change[0] for change in changes}:
+                self._versions[type_name] = table_version(CATALOG_MODELS[type_name].__tablename__)
+
+    def ensure_fresh(self):
+        # Reconstruye las tablas que han cambiado sin pasar por apply() (cargas masivas con
+        # INSERT de core) o que llevan más de SEARCH_INDEX_TTL sin reconstruirse: los cambios
+        # hechos en otros workers de gunicorn solo se ven así.
+        now = time.monotonic()
+        for type_name, model in CATALOG_MODELS.items():
+            stale = self._versions.get(type_name) != table_version(model.__tablename__)
+            expired = now - self._built_at.get(type_name, float('-inf')) > SEARCH_INDEX_TTL
+            if stale or expired:
+                self.rebuild(type_name, model)
+
+    def search(self, q, limit):
+        self.ensure_fresh()
+        q = q.lower()
+        found = {}
+        with self._lock:
+            position = bisect_left(self._entries, (q,))
+            while position < len(self._entries) and self._entries[position][0].startswith(q):
+                key, type_name, id, name = self._entries[position]
+                if name.lower() == q:
+                    score = EXACT_SCORE
+                elif name.lower().startswith(q):
+                    score = PREFIX_SCORE
+                else:
+                    score = WORD_PREFIX_SCORE
+                if score > found.get((type_name, id), (0,))[0]:
+                    found[(type_name, id)] = (score, name)
+                position += 1
+            candidates = self._fuzzy_candidates(q, found) if len(found) < limit else {}
+
+        results = [SearchResult(type_name, id, name, score) for (type_name, id), (score, name) in found.items()]
+        # Si con los prefijos no llegamos al límite completamos con nombres parecidos
+        if len(results) < limit:
+            seen = set(found)
+            for match in difflib.get_close_matches(q, candidates, n=limit - len(results), cutoff=FUZZY_CUTOFF):
+                score = round(difflib.SequenceMatcher(None, q, match).ratio(), 3)
+                for type_name, id, name in candidates[match]:
+                    if (type_name, id) not in seen:
+                        seen.add((type_name, id))
+                        results.append(SearchResult(type_name, id, name, score))
+
+        results.sort(key=lambda result: (-result.score, result.name))
+        return results[:limit]
+
+
+prefix_index = PrefixIndex()
+
+
+def search_postgres(q, limit):
+    # Una sola consulta (UNION ALL de las tres tablas) que usa los índices GIN de trigramas
+    pattern = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    parts = []
+    for type_name, model in CATALOG_MODELS.items():
+        score = case(
+            (func.lower(model.name) == q.lower(), EXACT_SCORE),
+            (model.name.ilike(pattern, escape='\\'), PREFIX_SCORE),
+            else_=0.0
+        ) + func.similarity(model.name, q)
+        parts.append(
+            select(literal(type_name).label('type'), model.id, model.name, score.label('score'))
+            .where(or_(model.name.ilike(pattern, escape='\\'), model.name.op('%')(q)))
+        )
+    results = union_all(*parts).subquery()
+    rows = db.session.execute(
+        select(results).order_by(results.c.score.desc(), results.c.name).limit(limit)
+    ).all()
+    return [SearchResult(row.type, row.id, row.name, round(float(row.score), 3)) for row in rows]
+
+
+def search_catalog(q, limit):
+    if db.engine.dialect.name == 'postgresql':
+        return search_postgres(q, limit)
+    return prefix_index.search(q, limit)
+
+
+# Mantenimiento incremental del índice en memoria: los cambios de cada flush se aplican
+# cuando el commit se ha hecho (ver cache.on_commit)
+TYPES_BY_TABLE = {model.__tablename__: type_name for type_name, model in CATALOG_MODELS.items()}
+
+
+def _collect_name_changes(session, changes, pending):
+    for table, type_name in TYPES_BY_TABLE.items():
+        for obj, deleted in changes.get(table, ()):
+            pending.append((type_name, obj.id, None if deleted else obj.name))
+
+
+def _apply_name_changes(changes):
+    # Solo si el índice ya se ha construido, si no se construirá entero en la primera búsqueda
+    if prefix_index._built_at:
+        prefix_index.apply(changes)
+
+
+on_commit('search_changes', _collect_name_changes, _apply_name_changes)
@@ -0,0 +1,286 @@
+"""
+Copia completa de los datos para moverlos entre entornos (desarrollo, staging, Render...).
+
+    flask snapshot export datos.ndjson.gz
+    flask snapshot import datos.ndjson.gz --replace
+
+El fichero es NDJSON: una línea de cabecera, y por cada tabla una línea {"table": ..., "columns": [...]}
+seguida de una línea por fila con los valores en un array (las claves van solo en la cabecera).
+Con extensión .gz se comprime con gzip y con .zst con zstd (necesita el paquete zstandard).
+
+Las tablas van en el orden de las claves ajenas (metadata.sorted_tables): usuarios y catálogo
+antes que favourites. catalog_stats y favourite_counts no se copian, se recalculan al importar,
+y data_versions tampoco (ver versions.py).
+
+La exportación lee cada tabla con un cursor de servidor (stream_results) por bloques, así la
+memoria no depende del tamaño de la base de datos. La importación va en una sola transacción:
+en Postgres con COPY y luego ajusta las secuencias de los id, en el resto con INSERT por lotes.
+"""
+import gzip
+import io
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from sqlalchemy import func, inspect, select, text
+from models import db, CatalogStat, FavouriteCount, DataVersion
+from cache import invalidate_tables
+from stats import rebuild_stats
+from versions import new_epoch
+
+FORMAT_VERSION = 1
+BATCH_SIZE = 5000
+
+# Se calculan a partir del resto de tablas (ver stats.rebuild_stats)
+DERIVED_TABLES = (CatalogStat.__tablename__, FavouriteCount.__tablename__)
+# Propias de cada base de datos: ni se copian ni se vacían (la importación cambia su epoch)
+LOCAL_TABLES = (DataVersion.__tablename__,)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_tables():
+    return [table for table in db.metadata.sorted_tables if table.name not in DERIVED_TABLES + LOCAL_TABLES]
+
+
+def open_snapshot(path, mode):
+    # mode 'r' o 'w', siempre en texto UTF-8
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    if path.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError:
+            raise SnapshotError('Para ficheros .zst hace falta el paquete zstandard')
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def current_revision(connection):
+    if not inspect(connection).has_table('alembic_version'):
+        return None
+    return connection.execute(text('SELECT version_num FROM alembic_version')).scalar()
+
+
+#--------------------------------------------------------------------------------------------------
+#EXPORTACIÓN
+
+def export_snapshot(path, batch_size=BATCH_SIZE):
+    dumps = current_app.json.dumps
+    connection = db.session.connection()
+    revision = current_revision(connection)
+    counts = {}
+    with open_snapshot(path, 'w') as output:
+        output.write(dumps({'snapshot': FORMAT_VERSION, 'revision': revision,
+                            'created': datetime.now(timezone.utc).isoformat()}) + '\n')
+        for table in snapshot_tables():
+            columns = list(table.columns)
+            output.write(dumps({'table': table.name, 'columns': [column.name for column in columns]}) + '\n')
+            stmt = select(*columns).order_by(*table.primary_key.columns)
+            result = connection.execution_options(stream_results=True).execute(stmt)
+            count = 0
+            try:
+                for rows in result.partitions(batch_size):
+                    output.write(''.join(dumps(list(row)) + '\n' for row in rows))
+                    count += len(rows)
+            finally:
+                result.close()
+            counts[table.name] = count
+    db.session.rollback()
+    return counts
+
+
+#--------------------------------------------------------------------------------------------------
+#IMPORTACIÓN
+
+def read_snapshot(lines):
+    # Genera primero (cabecera, None, None) y luego (tabla, columnas, None) al empezar cada
+    # tabla y (tabla, columnas, fila) por cada fila
+    loads = current_app.json.loads
+    header = loads(next(lines, '{}'))
+    if header.get('snapshot') != FORMAT_VERSION:
+        raise SnapshotError('El fichero no es una copia de este formato')
+    yield header, None, None
+    table = columns = None
+    for line in lines:
+        if line.startswith('{'):
+            section = loads(line)
+            table, columns = section['table'], section['columns']
+            yield table, columns, None
+        elif line.strip():
+            if table is None:
+                raise SnapshotError('Fila antes de la cabecera de su tabla')
+            yield table, columns, loads(line)
+
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_value(value):
+    # Formato de texto de COPY: \N es NULL y se escapan la barra, los tabuladores y los saltos de línea
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_rows(connection, table, columns, rows):
+    # COPY ... FROM STDIN, mucho más rápido que INSERT: Postgres lee las filas en un solo flujo
+    data = ''.join('\t'.join(copy_value(value) for value in row) + '\n' for row in rows)
+    preparer = connection.dialect.identifier_preparer
+    sql = 'COPY {} ({}) FROM STDIN'.format(
+        preparer.format_table(table), ', '.join(preparer.quote(name) for name in columns))
+    cursor = connection.connection.cursor()
+    try:
+        if hasattr(cursor, 'copy_expert'):
+            cursor.copy_expert(sql, io.StringIO(data))
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(data)
+    finally:
+        cursor.close()
+
+
+def insert_rows(connection, table, columns, rows):
+    if connection.dialect.name == 'postgresql':
+        copy_rows(connection, table, columns, rows)
+    else:
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def reset_sequences(connection, tables):
+    # Los id vienen en la copia: en Postgres las secuencias siguen en 1 y hay que adelantarlas
+    if connection.dialect.name != 'postgresql':
+        return
+    preparer = connection.dialect.identifier_preparer
+    for table in tables:
+        for column in table.primary_key.columns:
+            if not column.autoincrement or column.type.python_type is not int:
+                continue
+            sequence = connection.execute(
+                select(func.pg_get_serial_sequence(preparer.format_table(table), column.name))).scalar()
+            if sequence:
+                last = connection.execute(select(func.max(column))).scalar()
+                connection.execute(select(func.setval(sequence, last or 1, last is not None)))
+
+
+def clear_tables(connection):
+    tables = [table for table in reversed(db.metadata.sorted_tables) if table.name not in LOCAL_TABLES]
+    if connection.dialect.name == 'postgresql':
+        preparer = connection.dialect.identifier_preparer
+        connection.execute(text('TRUNCATE ' + ', '.join(preparer.format_table(table) for table in tables)))
+    else:
+        for table in tables:
+            connection.execute(table.delete())
+
+
+def load_rows(connection, tables, entries, batch_size):
+    counts = {}
+    chunk = []
+    table = columns = None
+
+    def flush():
+        if chunk:
+            insert_rows(connection, table, columns, chunk)
+            counts[table.name] += len(chunk)
+            chunk.clear()
+
+    for name, names, row in entries:
+        if row is not None:
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                flush()
+            continue
+        flush()
+        if name not in tables:
+            raise SnapshotError(f'Tabla desconocida en la copia: {name}')
+        unknown = [column for column in names if column not in tables[name].columns]
+        if unknown:
+            raise SnapshotError(f'Columnas desconocidas en {name}: ' + ', '.join(unknown))
+        table, columns = tables[name], names
+        counts[name] = 0
+    flush()
+    return counts
+
+
+def import_snapshot(path, replace=False, batch_size=BATCH_SIZE):
+    tables = {table.name: table for table in snapshot_tables()}
+    connection = db.session.connection()
+    try:
+        if replace:
+            clear_tables(connection)
+        else:
+            for table in tables.values():
+                if connection.execute(select(table).limit(1)).first():
+                    raise SnapshotError(f'La tabla {table.name} ya tiene datos, usa --replace para vaciarlas')
+
+        with open_snapshot(path, 'r') as source:
+            entries = read_snapshot(iter(source))
+            header, _, _ = next(entries)
+            revision = current_revision(connection)
+            if header.get('revision') and revision and header['revision'] != revision:
+                raise SnapshotError(f'La copia es de la migración {header["revision"]} y la base de datos '
+                                    f'está en {revision}: ejecuta flask db upgrade en las dos antes')
+            counts = load_rows(connection, tables, entries, batch_size)
+
+        reset_sequences(connection, tables.values())
+        # Los ETag de las rutas de usuario no pueden coincidir con los de los datos anteriores
+        new_epoch(connection)
+        # Los INSERT de core no pasan por los eventos: contadores de /stats y ranking desde cero
+        rebuild_stats()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_tables(tables)
+    return counts
+
+
+def report(counts, done):
+    for name, count in counts.items():
+        click.echo(f'{name}: {count} filas')
+    click.echo(f'{sum(counts.values())} filas {done}')
+
+
+def fail(error):
+    # Los errores van a stderr y el comando sale con código 1
+    click.echo(f'Error: {error}', err=True)
+    click.get_current_context().exit(1)
+
+
+def init_snapshot(app):
+    @app.cli.group('snapshot')
+    def snapshot_cli():
+        """Copia completa de los datos en un fichero NDJSON (.gz o .zst para comprimirlo)."""
+
+    @snapshot_cli.command('export')
+    @click.argument('path')
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Filas por bloque del cursor')
+    def export_command(path, batch_size):
+        """Guarda todas las tablas en PATH."""
+        start = time.perf_counter()
+        try:
+            counts = export_snapshot(path, batch_size)
+        except (SnapshotError, OSError) as error:
+            fail(error)
+        report(counts, f'exportadas a {path} en {time.perf_counter() - start:.1f} s')
+
+    @snapshot_cli.command('import')
+    @click.argument('path')
+    @click.option('--replace', is_flag=True, help='Vacía las tablas antes de importar')
+    @click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Filas por COPY o INSERT')
+    def import_command(path, replace, batch_size):
+        """Carga la copia PATH en una sola transacción."""
+        start = time.perf_counter()
+        try:
+            counts = import_snapshot(path, replace, batch_size)
+        except (SnapshotError, OSError) as error:
+            fail(error)
+        report(counts, f'importadas de {path} en {time.perf_counter() - start:.1f} s')
@@ -0,0 +1,176 @@
+"""
+Estadísticas agregadas del catálogo para GET /stats.
+
+Los totales (número de filas, población total, tripulación media, personajes por género) se
+guardan como contadores en la tabla catalog_stats y se actualizan en la misma transacción que
+cada INSERT, UPDATE o DELETE del catálogo: los eventos del mapper cubren el ORM (la API y el
+admin) y bulk_insert suma los de cada bloque. Leerlos es una consulta a una tabla de pocas
+filas, sin recorrer el catálogo.
+
+Si alguien cambia las tablas por fuera (SQL a mano, una restauración...) los contadores se
+recalculan con GROUP BY con:
+
+    flask stats rebuild
+"""
+from collections import Counter
+import click
+from sqlalchemy import event, func, select
+from sqlalchemy.orm.attributes import get_history
+from models import db, CatalogStat, Characters, Planets, Starships
+from utils import increment_counters, locked_values
+from popularity import top_items, rebuild_counts
+
+MOST_FAVOURITED_LIMIT = 5
+
+
+def planet_stats(values):
+    return {'planets.count': 1, 'planets.population_total': values.get('population') or 0}
+
+
+def starship_stats(values):
+    crew = values.get('crew')
+    return {
+        'starships.count': 1,
+        'starships.crew_total': crew or 0,
+        'starships.crew_known': int(crew is not None)
+    }
+
+
+def character_stats(values):
+    return {'characters.count': 1, f'characters.gender.{values.get("gender") or "unknown"}': 1}
+
+
+# Para cada modelo: columnas de las que dependen los contadores y cómo se calculan
+TRACKED = {
+    Planets: (('population',), planet_stats),
+    Starships: (('crew',), starship_stats),
+    Characters: (('gender',), character_stats)
+}
+
+
+def deltas_for(model, rows, sign=1):
+    _, stats = TRACKED[model]
+    deltas = Counter()
+    for values in rows:
+        for name, value in stats(values).items():
+            deltas[name] += sign * value
+    return deltas
+
+
+def apply_deltas(connection, deltas):
+    # value = value + delta para cada contador, creándolo si no existe, en una sola sentencia
+    params = [{'name': name, 'value': value} for name, value in deltas.items() if value]
+    increment_counters(connection, CatalogStat.__table__, ['name'], params)
+
+
+#--------------------------------------------------------------------------------------------------
+#EVENTOS DEL MAPPER (se ejecutan dentro del flush, en la misma transacción que el cambio)
+
+def _values(target, columns):
+    return {column: getattr(target, column) for column in columns}
+
+
+def _listen(model, columns):
+    @event.listens_for(model, 'after_insert')
+    def after_insert(mapper, connection, target):
+        apply_deltas(connection, deltas_for(model, [_values(target, columns)]))
+
+    @event.listens_for(model, 'before_delete')
+    def before_delete(mapper, connection, target):
+        # Se resta la fila tal como está en la base de datos, bloqueada hasta el commit para que
+        # el DELETE la borre seguro, y nada si otra transacción ya la había borrado
+        values = locked_values(connection, mapper, target, columns)
+        if values is not None:
+            apply_deltas(connection, deltas_for(model, [values], -1))
+
+    @event.listens_for(model, 'after_update')
+    def after_update(mapper, connection, target):
+        old, new = {}, {}
+        for column in columns:
+            history = get_history(target, column)
+            if not history.has_changes():
+                old[column] = new[column] = getattr(target, column)
+                continue
+            old[column] = history.deleted[0] if history.deleted else None
+            new[column] = history.added[0] if history.added else None
+        if old != new:
+            deltas = deltas_for(model, [new])
+            deltas.subtract(deltas_for(model, [old]))
+            apply_deltas(connection, deltas)
+
+    for column in columns:
+        # active_history: el ORM carga el valor anterior antes de cambiarlo, para poder restarlo
+        event.listen(getattr(model, column), 'set', lambda *args: None, active_history=True)
+
+
+for _model, (_columns, _) in TRACKED.items():
+    _listen(_model, _columns)
+
+
+#--------------------------------------------------------------------------------------------------
+#LECTURA Y RECONSTRUCCIÓN
+
+def most_favourited(limit=MOST_FAVOURITED_LIMIT):
+    # Del ranking en memoria de popularity.py, sin GROUP BY sobre favoritos
+    return {target_type: top_items(target_type, limit) for target_type in ('characters', 'planets', 'starships')}
+
+
+def catalog_stats():
+    values = dict(db.session.execute(select(CatalogStat.name, CatalogStat.value)).all())
+    crew_known = values.get('starships.crew_known', 0)
+    prefix = 'characters.gender.'
+    return {
+        'planets': {
+            'count': values.get('planets.count', 0),
+            'population_total': values.get('planets.population_total', 0)
+        },
+        'starships': {
+            'count': values.get('starships.count', 0),
+            'average_crew': round(values.get('starships.crew_total', 0) / crew_known, 2) if crew_known else None
+        },
+        'characters': {
+            'count': values.get('characters.count', 0),
+            'gender': {name[len(prefix):]: value for name, value in values.items()
+                       if name.startswith(prefix) and value}
+        },
+        'most_favourited': most_favourited()
+    }
+
+
+def compute_stats(connection):
+    # Los mismos contadores calculados desde cero con agregados y GROUP BY
+    deltas = Counter()
+    planets = connection.execute(select(func.count(), func.coalesce(func.sum(Planets.population), 0))).one()
+    deltas.update({'planets.count': planets[0], 'planets.population_total': planets[1]})
+
+    starships = connection.execute(
+        select(func.count(), func.coalesce(func.sum(Starships.crew), 0), func.count(Starships.crew))
+    ).one()
+    deltas.update({'starships.count': starships[0], 'starships.crew_total': starships[1],
+                   'starships.crew_known': starships[2]})
+
+    for gender, count in connection.execute(select(Characters.gender, func.count()).group_by(Characters.gender)):
+        deltas.update(deltas_for(Characters, [{'gender': gender}], count))
+    return deltas
+
+
+def rebuild_stats():
+    connection = db.session.connection()
+    db.session.execute(CatalogStat.__table__.delete())
+    deltas = compute_stats(connection)
+    apply_deltas(connection, deltas)
+    rebuild_counts()
+    db.session.commit()
+    return deltas
+
+
+def init_stats(app):
+    @app.cli.group('stats')
+    def stats_cli():
+        """Estadísticas agregadas del catálogo."""
+
+    @stats_cli.command('rebuild')
+    def rebuild_command():
+        """Recalcula los contadores de /stats y del ranking de favoritos con GROUP BY."""
+        deltas = rebuild_stats()
+        click.echo(f'{len(deltas)} contadores recalculados')
@@ -1,4 +1,9 @@
-from flask import jsonify, url_for
+import hashlib
+import json
+from importlib import import_module
+from flask import jsonify, url_for, request, current_app
+from sqlalchemy import and_, select
+from records import Record
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +20,64 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def _etag_default(value):
+    return value.as_dict() if isinstance(value, Record) else str(value)
+
+def content_etag(value):
+    # ETag fuerte calculado sobre el contenido, igual en todos los workers
+    raw = json.dumps(value, sort_keys=True, separators=(',', ':'), default=_etag_default)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def not_modified(etag):
+    # Devuelve un 304 si el cliente ya tiene esta versión (If-None-Match), si no None
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def dialect_insert(dialect):
+    # insert() con ON CONFLICT / ON DUPLICATE KEY del dialecto. Se importa solo el de la base de
+    # datos configurada (el engine ya lo ha cargado), no los de Postgres y MySQL a la vez
+    return import_module(f'sqlalchemy.dialects.{dialect}').insert
+
+def increment_counters(connection, table, key_columns, params):
+    # Suma 'value' al contador de cada clave (cada param trae las key_columns y value),
+    # creándolo si no existe; en Postgres, SQLite y MySQL es una sola sentencia
+    if not params:
+        return
+    keys = [table.c[column] for column in key_columns]
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        stmt = dialect_insert(dialect)(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={'value': table.c.value + stmt.excluded.value})
+        connection.execute(stmt, params)
+    elif dialect == 'mysql':
+        stmt = dialect_insert(dialect)(table)
+        connection.execute(stmt.on_duplicate_key_update(value=table.c.value + stmt.inserted.value), params)
+    else:
+        for param in params:
+            where = and_(*[key == param[key.name] for key in keys])
+            result = connection.execute(table.update().where(where).values(value=table.c.value + param['value']))
+            if not result.rowcount:
+                connection.execute(table.insert().values(**param))
+
+def locked_values(connection, mapper, target, columns):
+    # Para los eventos before_delete: lee las columnas de la fila que se va a borrar y la bloquea
+    # hasta el commit (FOR UPDATE, que SQLite ignora), así el DELETE del flush la borra seguro.
+    # None si otra transacción ya la había borrado.
+    table = mapper.local_table
+    where = and_(*[column == value for column, value in zip(mapper.primary_key, mapper.primary_key_from_instance(target))])
+    row = connection.execute(select(*[table.c[column] for column in columns]).where(where).with_for_update()).first()
+    return dict(row._mapping) if row else None
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if app.config.get('ENABLE_ADMIN') else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,81 @@
+"""
+Versiones de los datos para los ETag de /users, /user/<id>, /user/<id>/favourites y /user/<id>/profile.
+
+Cada versión es un contador de la tabla data_versions que sube en la misma transacción que el
+cambio: al final de cada flush del ORM (la API y el admin) y a mano en los INSERT y DELETE de core.
+El ETag se calcula con una consulta por clave primaria antes de leer los datos, así un 304 se ahorra
+la consulta y la serialización, y al estar en la base de datos vale igual en todos los workers.
+
+    user                            cualquier usuario (/users)
+    user.<id>                       un usuario
+    favourites.<id>                 los favoritos de un usuario
+    characters, planets, starships  el catálogo (los favoritos y el perfil llevan sus datos)
+    epoch                           aleatorio al crear la tabla y con cada flask snapshot import,
+                                    para que una base de datos nueva no repita ETags de la anterior
+"""
+import secrets
+from sqlalchemy import event, select
+from sqlalchemy.orm.attributes import get_history
+from models import db, DataVersion
+from utils import content_etag, increment_counters
+from cache import on_commit
+
+EPOCH = 'epoch'
+CATALOG = ('characters', 'planets', 'starships')
+
+
+def bump(connection, names):
+    # Ordenadas para que dos transacciones bloqueen las filas siempre en el mismo orden
+    increment_counters(connection, DataVersion.__table__, ['name'],
+                       [{'name': name, 'value': 1} for name in sorted(set(names))])
+
+
+def new_epoch(connection):
+    table = DataVersion.__table__
+    connection.execute(table.delete().where(table.c.name == EPOCH))
+    connection.execute(table.insert().values(name=EPOCH, value=secrets.randbelow(2 ** 62)))
+
+
+def etag_query(names):
+    # Nombres con el epoch y el SELECT de sus versiones (asgi.py lo ejecuta con su driver)
+    names = [EPOCH, *names]
+    return names, select(DataVersion.name, DataVersion.value).where(DataVersion.name.in_(names))
+
+
+def version_etag(names, rows, *extra):
+    values = dict(rows)
+    return content_etag([[name, values.get(name, 0)] for name in names] + list(extra))
+
+
+def data_etag(names, *extra):
+    # ETag de los datos que dependen de names (y de extra, p. ej. los parámetros de la ruta)
+    names, stmt = etag_query(names)
+    return version_etag(names, db.session.execute(stmt).all(), *extra)
+
+
+def changed_names(changes):
+    names = set()
+    for obj, _ in changes.get('user', ()):
+        names.update(('user', f'user.{obj.id}'))
+    for obj, _ in changes.get('favourites', ()):
+        # Un favorito editado desde el admin puede cambiar de usuario: cuentan los dos
+        history = get_history(obj, 'user_id')
+        for user_id in [obj.user_id, *history.deleted]:
+            if user_id is not None:
+                names.add(f'favourites.{user_id}')
+    names.update(table for table in CATALOG if table in changes)
+    return names
+
+
+def _bump_flushed(session, changes, pending):
+    names = changed_names(changes)
+    if names:
+        bump(session.connection(), names)
+
+
+on_commit('data_versions', _bump_flushed, lambda pending: None)
+
+
+@event.listens_for(DataVersion.__table__, 'after_create')
+def _create_epoch(table, connection, **kwargs):
+    new_epoch(connection)
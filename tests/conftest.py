@@ -0,0 +1,68 @@
+"""
+Fixtures comunes: la app contra una SQLite temporal con las tablas recién creadas en cada test.
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+import pytest
+
+# Antes de importar la app, que lee la configuración del entorno al cargarse
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+os.environ['ENABLE_ADMIN'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def app():
+    from app import app as flask_app
+    from models import db
+    from cache import catalog_cache
+    from auth import user_status
+    from popularity import tops
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    catalog_cache.clear()
+    user_status.clear()
+    for topk in tops.values():
+        topk.invalidate()
+    yield flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    from auth import issue_token
+    return lambda user_id: {'Authorization': 'Bearer ' + issue_token(user_id, 'access')}
+
+
+@pytest.fixture
+def count_queries(app):
+    # with count_queries() as statements: ... -> lista con las sentencias SQL ejecutadas dentro
+    from sqlalchemy import event
+    from models import db
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return counter
@@ -0,0 +1,91 @@
+import pytest
+import auth
+from models import db, User, Favourites, Planets
+from passwords import hash_password
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        luke = User(email='luke@tatooine.org', password=hash_password('secret'), is_active=True)
+        leia = User(email='leia@alderaan.org', password='x', is_active=True)
+        db.session.add_all([luke, leia, Favourites(user=luke, planet=Planets(name='Tatooine'))])
+        db.session.commit()
+        return luke.id, leia.id
+
+
+def login(client):
+    response = client.post('/login', json={'email': 'luke@tatooine.org', 'password': 'secret'})
+    assert response.status_code == 200
+    return response.json
+
+
+def bearer(token):
+    return {'Authorization': 'Bearer ' + token}
+
+
+def test_protected_routes_need_the_owner_token(client, users):
+    luke, leia = users
+    tokens = login(client)
+    assert tokens['token_type'] == 'Bearer' and tokens['expires_in'] == auth.ACCESS_TOKEN_TTL
+
+    assert client.get(f'/user/{luke}', headers=bearer(tokens['access_token'])).status_code == 200
+    assert client.get(f'/user/{leia}', headers=bearer(tokens['access_token'])).status_code == 403
+    missing = client.get(f'/user/{luke}')
+    assert missing.status_code == 401 and missing.headers['WWW-Authenticate'] == 'Bearer'
+    assert client.get(f'/user/{luke}', headers=bearer('not-a-token')).status_code == 401
+    # Un refresh token no sirve como access token
+    assert client.get(f'/user/{luke}', headers=bearer(tokens['refresh_token'])).status_code == 401
+
+
+def test_token_check_does_not_query(client, users, count_queries):
+    luke, _ = users
+    headers = bearer(login(client)['access_token'])
+    client.get(f'/user/{luke}/favourites', headers=headers)
+    with count_queries() as statements:
+        assert client.get(f'/user/{luke}/favourites', headers=headers).status_code == 200
+    assert not any('is_active' in statement for statement in statements)
+
+
+def test_deactivated_user_is_rejected_at_once(app, client, users):
+    luke, _ = users
+    headers = bearer(login(client)['access_token'])
+    assert client.get(f'/user/{luke}', headers=headers).status_code == 200
+    with app.app_context():
+        db.session.get(User, luke).is_active = False
+        db.session.commit()
+    assert client.get(f'/user/{luke}', headers=headers).status_code == 403
+
+
+def test_expired_token(client, users, monkeypatch):
+    luke, _ = users
+    headers = bearer(login(client)['access_token'])
+    monkeypatch.setitem(auth._ttls, 'access', -1)
+    response = client.get(f'/user/{luke}', headers=headers)
+    assert response.status_code == 401 and response.json['msg'] == 'El token ha caducado'
+
+
+def test_refresh_rotates_the_token(client, users):
+    luke, _ = users
+    tokens = login(client)
+    refreshed = client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert refreshed.status_code == 200
+    assert client.get(f'/user/{luke}', headers=bearer(refreshed.json['access_token'])).status_code == 200
+
+    # El refresh token usado queda revocado
+    reused = client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert reused.status_code == 401 and reused.json['msg'] == 'El token ha sido revocado'
+    assert client.post('/token/refresh', json={'refresh_token': tokens['access_token']}).status_code == 401
+    assert client.post('/token/refresh', json={}).status_code == 400
+
+
+def test_logout_revokes_both_tokens(client, users):
+    luke, _ = users
+    tokens = login(client)
+    headers = bearer(tokens['access_token'])
+    assert client.post('/logout', json={'refresh_token': tokens['refresh_token']}, headers=headers).status_code == 200
+
+    assert client.get(f'/user/{luke}', headers=headers).status_code == 401
+    assert client.post('/token/refresh', json={'refresh_token': tokens['refresh_token']}).status_code == 401
+    # Otra sesión del mismo usuario sigue valiendo
+    assert client.get(f'/user/{luke}', headers=bearer(login(client)['access_token'])).status_code == 200
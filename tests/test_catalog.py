@@ -0,0 +1,130 @@
+import pytest
+from sqlalchemy import text
+from werkzeug.datastructures import MultiDict
+from models import db, Planets
+from catalog import CATALOG_MODELS, build_selects, encode_cursor
+
+
+@pytest.fixture
+def planets(app):
+    # Poblaciones repetidas y un 10% de NULL, para que las páginas crucen de los valores a los NULL
+    rows = [{'name': f'planet {i % 40:02d}', 'population': None if i % 10 == 0 else i % 13} for i in range(200)]
+    with app.app_context():
+        db.session.execute(Planets.__table__.insert(), rows)
+        db.session.commit()
+        return [(row.id, row.name, row.population) for row in db.session.execute(
+            db.select(Planets.id, Planets.name, Planets.population))]
+
+
+def walk(client, query):
+    # Sigue los cursores 'next' hasta el final y devuelve los ids en el orden recibido
+    ids, after = [], None
+    while True:
+        response = client.get(f'/planets?limit=7&fields=name,population&{query}' + (f'&after={after}' if after else ''))
+        assert response.status_code == 200
+        ids += [planet['id'] for planet in response.json['planets']]
+        after = response.json['next']
+        if after is None:
+            return ids
+
+
+@pytest.mark.parametrize('sort', ['population', '-population', 'name', '-name'])
+def test_sorted_pages_follow_index_order(client, planets, sort):
+    # En SQLite NULL es menor que cualquier valor; en descendente el orden es el inverso exacto
+    column = 2 if sort.endswith('population') else 1
+    expected = [row[0] for row in sorted(planets, key=lambda row: (row[column] is not None, row[column] or 0, row[0]))]
+    if sort.startswith('-'):
+        expected.reverse()
+    assert walk(client, f'sort={sort}') == expected
+
+
+def test_unsorted_pages_follow_id(client, planets):
+    assert walk(client, '') == sorted(row[0] for row in planets)
+
+
+@pytest.mark.parametrize('cursor', [[{'a': 1}, 1], [[1], 1], ['abc', 1], [1.5, 1], [True, 1], [1, True], [1, 'x']])
+def test_malformed_sorted_cursor_is_rejected(client, planets, cursor):
+    response = client.get('/planets?sort=population&after=' + encode_cursor(cursor))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('cursor', [[True], ['1'], [None], [1, 2]])
+def test_malformed_cursor_is_rejected(client, planets, cursor):
+    assert client.get('/planets?after=' + encode_cursor(cursor)).status_code == 400
+
+
+def plans(model, args):
+    stmts, _ = build_selects(model, MultiDict(args), db.engine.dialect.name)
+    for stmt in stmts:
+        sql = str(stmt.limit(101).compile(db.engine, compile_kwargs={'literal_binds': True}))
+        yield [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('model,column', [(model, column) for model in CATALOG_MODELS.values()
+                                          for column in model.SORTABLE])
+def test_sorted_pages_use_composite_index(app, planets, model, column, descending):
+    # Primera página, página con un valor en el cursor y página dentro de los NULL: todas
+    # recorren el índice (columna, id) sin ordenar en una tabla temporal
+    value = 'm' if column == 'name' else 5
+    sort = ('-' if descending else '') + column
+    index = f'ix_{model.__tablename__}_{column}_id'
+    with app.app_context():
+        for args in ({'sort': sort}, {'sort': sort, 'after': encode_cursor([value, 10])},
+                     {'sort': sort, 'after': encode_cursor([None, 10])}):
+            for plan in plans(model, args):
+                assert not any('TEMP B-TREE' in step for step in plan), (args, plan)
+                assert any(index in step for step in plan), (args, plan)
+
+
+def test_unsorted_pages_use_primary_key(app, planets):
+    with app.app_context():
+        for args in ({}, {'after': encode_cursor([10])}):
+            for plan in plans(Planets, args):
+                assert not any('TEMP B-TREE' in step for step in plan), plan
+                assert any('PRIMARY KEY' in step or step == 'SCAN planets' for step in plan), plan
+
+
+def test_bulk_insert_reports_row_errors(client):
+    rows = [{'name': 'Tatooine', 'population': 200000}, {'name': 'Hoth', 'population': 'many'},
+            {'population': 1}, 'Naboo', {'name': 'Alderaan', 'moons': 0}, {'name': 'Dagobah'}]
+    response = client.post('/add_datas?type=planets', json=rows)
+    assert response.status_code == 201 and response.json['inserted'] == 2
+    assert [error['index'] for error in response.json['errors']] == [1, 2, 3, 4]
+    assert client.get('/stats').json['planets']['count'] == 2
+    assert [planet['name'] for planet in client.get('/planets').json['planets']] == ['Tatooine', 'Dagobah']
+
+
+def test_bulk_insert_ndjson(client):
+    body = '{"name": "Luke", "gender": "male"}\n\nnot json\n{"name": "Leia"}\n'
+    response = client.post('/add_datas?type=characters', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 201 and response.json['inserted'] == 2
+    assert response.json['errors'] == [{'index': 1, 'error': 'JSON no valido'}]
+
+
+def test_bulk_insert_only_invalid_rows(client):
+    response = client.post('/add_datas?type=planets', json=[{}, {'name': 1}])
+    assert response.status_code == 400 and response.json['inserted'] == 0
+    assert client.post('/add_datas?type=moons', json=[{'name': 'Endor'}]).status_code == 400
+
+
+def test_bulk_insert_failed_chunk_keeps_the_rest(app, client, monkeypatch):
+    # Un bloque que falla se deshace entero y se informa con su rango; los demás quedan guardados
+    import catalog
+    from sqlalchemy.exc import OperationalError
+    monkeypatch.setattr(catalog, 'BATCH_CHUNK_SIZE', 2)
+    apply_deltas, calls = catalog.apply_deltas, []
+
+    def failing_deltas(connection, deltas):
+        calls.append(deltas)
+        if len(calls) == 2:
+            raise OperationalError('INSERT', {}, Exception('disk I/O error'))
+        apply_deltas(connection, deltas)
+
+    monkeypatch.setattr(catalog, 'apply_deltas', failing_deltas)
+    response = client.post('/add_datas?type=planets', json=[{'name': f'planet {i}'} for i in range(5)])
+    assert response.status_code == 201 and response.json['inserted'] == 3
+    assert response.json['errors'] == [{'from_index': 2, 'to_index': 3, 'error': 'disk I/O error'}]
+    with app.app_context():
+        assert db.session.execute(db.select(Planets.name)).scalars().all() == ['planet 0', 'planet 1', 'planet 4']
+    assert client.get('/stats').json['planets']['count'] == 3
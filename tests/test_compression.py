@@ -0,0 +1,62 @@
+import gzip
+import pytest
+from models import db, Planets
+from compression import compressed_cache
+
+
+@pytest.fixture
+def planets(app):
+    # Una página bastante grande para pasar de COMPRESSION_MIN_SIZE
+    compressed_cache.clear()
+    with app.app_context():
+        db.session.execute(Planets.__table__.insert(), [{'name': f'planet {i}'} for i in range(100)])
+        db.session.commit()
+
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_compressed_page_has_weak_etag(client, planets):
+    plain = client.get('/planets')
+    assert 'Content-Encoding' not in plain.headers
+    etag = plain.headers['ETag']
+    assert not etag.startswith('W/')
+
+    compressed = client.get('/planets', headers=GZIP)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == 'W/' + etag
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+    # La segunda vez sale de la caché de cuerpos comprimidos
+    assert client.get('/planets', headers=GZIP).data == compressed.data
+    assert compressed_cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('encoding,weak', [('gzip', True), ('identity', False)])
+def test_not_modified_echoes_the_client_etag(client, planets, encoding, weak):
+    response = client.get('/planets', headers={'Accept-Encoding': encoding})
+    etag = response.headers['ETag']
+    assert etag.startswith('W/') == weak
+
+    cached = client.get('/planets', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    assert 'Content-Encoding' not in cached.headers
+    assert cached.headers['ETag'] == etag
+    assert 'Accept-Encoding' in cached.headers['Vary']
+
+
+def test_etags_match_across_encodings(client, planets):
+    # El ETag fuerte sin comprimir también vale para pedir la versión comprimida y al revés
+    strong = client.get('/planets').headers['ETag']
+    weak = client.get('/planets', headers=GZIP).headers['ETag']
+    assert client.get('/planets', headers={**GZIP, 'If-None-Match': strong}).status_code == 304
+    assert client.get('/planets', headers={'If-None-Match': weak}).status_code == 304
+
+
+def test_small_bodies_are_not_compressed(client, app):
+    with app.app_context():
+        db.session.add(Planets(name='Tatooine'))
+        db.session.commit()
+    response = client.get('/planets', headers=GZIP)
+    assert response.status_code == 200 and 'Content-Encoding' not in response.headers
+    assert not response.headers['ETag'].startswith('W/')
@@ -0,0 +1,74 @@
+import pytest
+from models import db, User, Favourites, Planets
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        planet = Planets(name='Tatooine')
+        first = User(email='first@test', password='x', is_active=True)
+        second = User(email='second@test', password='x', is_active=True)
+        db.session.add_all([first, second, Favourites(user=first, planet=planet)])
+        db.session.commit()
+        return first.id, second.id, planet.id
+
+
+def revalidate(client, count_queries, path, headers=None):
+    # Primera petición y la misma con If-None-Match: devuelve (respuesta, 304, sentencias del 304)
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200 and response.headers['ETag']
+    with count_queries() as statements:
+        cached = client.get(path, headers={**(headers or {}), 'If-None-Match': response.headers['ETag']})
+    return response, cached, statements
+
+
+@pytest.mark.parametrize('path', ['/users', '/user/{id}', '/user/{id}/favourites', '/user/{id}/profile?expand=all'])
+def test_not_modified_before_querying(client, auth_headers, count_queries, users, path):
+    user_id = users[0]
+    response, cached, statements = revalidate(client, count_queries, path.format(id=user_id), auth_headers(user_id))
+    assert cached.status_code == 304 and cached.data == b''
+    # Solo la consulta de las versiones: ni usuarios ni favoritos
+    assert len(statements) == 1 and 'data_versions' in statements[0]
+
+
+def test_users_etag_follows_edits(client, auth_headers, count_queries, users):
+    user_id = users[0]
+    response, _, _ = revalidate(client, count_queries, '/users')
+    edited = client.put(f'/edit_user/{user_id}', json={'email': 'edited@test', 'is_active': True},
+                        headers=auth_headers(user_id))
+    assert edited.status_code == 200
+    again = client.get('/users', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 200 and 'edited@test' in [user['email'] for user in again.json['data']]
+
+
+def test_favourites_etag_follows_favourites_and_catalog(app, client, auth_headers, count_queries, users):
+    user_id, _, planet_id = users
+    headers = auth_headers(user_id)
+    response, _, _ = revalidate(client, count_queries, f'/user/{user_id}/favourites', headers)
+    etag = response.headers['ETag']
+
+    # El nombre del planeta sale en los favoritos
+    with app.app_context():
+        db.session.get(Planets, planet_id).name = 'Tatooine II'
+        db.session.commit()
+    renamed = client.get(f'/user/{user_id}/favourites', headers={**headers, 'If-None-Match': etag})
+    assert renamed.status_code == 200 and renamed.json['favourites'][0]['planet_name'] == 'Tatooine II'
+
+    # Altas y bajas, también las de core (insert_favourite y remove_favourites)
+    for change in ('add', 'remove'):
+        etag = client.get(f'/user/{user_id}/favourites', headers=headers).headers['ETag']
+        if change == 'add':
+            with app.app_context():
+                db.session.add(Planets(name='Naboo'))
+                db.session.commit()
+            assert client.post(f'/user/{user_id}/favourites', json={'planet_id': planet_id + 1}, headers=headers).status_code == 200
+        else:
+            assert client.post(f'/user/{user_id}/favourites/batch', json={'remove': [{'planet_id': planet_id + 1}]},
+                               headers=headers).json['results'][0]['status'] == 'removed'
+        assert client.get(f'/user/{user_id}/favourites', headers={**headers, 'If-None-Match': etag}).status_code == 200
+
+
+def test_each_user_has_its_own_etag(client, auth_headers, users):
+    first, second, _ = users
+    etags = [client.get(f'/user/{user_id}', headers=auth_headers(user_id)).headers['ETag'] for user_id in (first, second)]
+    assert etags[0] != etags[1]
@@ -0,0 +1,139 @@
+import pytest
+from models import db, User, Favourites, Planets, Characters, Starships, FavouriteCount
+
+
+def seed_user(email, favourites):
+    # Un usuario con `favourites` favoritos repartidos entre planetas, personajes y naves
+    user = User(email=email, password='x', is_active=True)
+    db.session.add(user)
+    for i in range(favourites):
+        if i % 3 == 0:
+            target = Planets(name=f'{email} planet {i}')
+            db.session.add(Favourites(user=user, planet=target))
+        elif i % 3 == 1:
+            target = Characters(name=f'{email} character {i}')
+            db.session.add(Favourites(user=user, character=target))
+        else:
+            target = Starships(name=f'{email} starship {i}')
+            db.session.add(Favourites(user=user, starship=target))
+    db.session.commit()
+    return user.id
+
+
+def test_get_favourites_query_count_does_not_depend_on_favourites(app, client, auth_headers, count_queries):
+    with app.app_context():
+        one = seed_user('one@test', 1)
+        many = seed_user('many@test', 30)
+
+    counts = {}
+    for user_id, expected in ((one, 1), (many, 30)):
+        with count_queries() as statements:
+            response = client.get(f'/user/{user_id}/favourites', headers=auth_headers(user_id))
+        assert response.status_code == 200
+        assert len(response.json['favourites']) == expected
+        counts[expected] = len(statements)
+
+    assert counts[1] == counts[30]
+
+
+class PlainInsert:
+    # insert() de una base de datos sin ON CONFLICT: el duplicado llega como IntegrityError
+    def __init__(self, table):
+        self.stmt = table.insert()
+
+    def values(self, values):
+        self.stmt = self.stmt.values(values)
+        return self
+
+    def on_conflict_do_nothing(self):
+        return self.stmt
+
+
+def planet_counts(app):
+    with app.app_context():
+        return dict(db.session.execute(db.select(FavouriteCount.target_id, FavouriteCount.value)
+                                       .where(FavouriteCount.target_type == 'planets')).all())
+
+
+def test_add_favourite_once(app, client, auth_headers):
+    with app.app_context():
+        user_id = seed_user('fan@test', 0)
+        planet = Planets(name='Tatooine')
+        db.session.add(planet)
+        db.session.commit()
+        planet_id = planet.id
+
+    headers = auth_headers(user_id)
+    created = client.post(f'/user/{user_id}/favourites', json={'planet_id': planet_id}, headers=headers)
+    assert created.status_code == 200 and created.json['favourite']['planet_name'] == 'Tatooine'
+    duplicate = client.post(f'/user/{user_id}/favourites', json={'planet_id': planet_id}, headers=headers)
+    assert duplicate.status_code == 200 and 'favourite' not in duplicate.json
+    assert planet_counts(app) == {planet_id: 1}
+
+
+def test_add_favourite_integrity_error_is_409(app, client, auth_headers, monkeypatch):
+    import favourites
+    with app.app_context():
+        user_id = seed_user('fan@test', 0)
+        planet = Planets(name='Tatooine')
+        db.session.add(planet)
+        db.session.commit()
+        planet_id = planet.id
+
+    headers = auth_headers(user_id)
+    assert client.post(f'/user/{user_id}/favourites', json={'planet_id': planet_id}, headers=headers).status_code == 200
+    monkeypatch.setattr(favourites, 'dialect_insert', lambda dialect: PlainInsert)
+    duplicate = client.post(f'/user/{user_id}/favourites', json={'planet_id': planet_id}, headers=headers)
+    assert duplicate.status_code == 409 and duplicate.json['message']
+
+    # La transacción se ha deshecho: ni favorito repetido ni contador sumado dos veces
+    assert len(client.get(f'/user/{user_id}/favourites', headers=headers).json['favourites']) == 1
+    assert planet_counts(app) == {planet_id: 1}
+
+
+@pytest.mark.parametrize('expand', ['', 'planet', 'all'])
+def test_profile_query_count_does_not_depend_on_favourites(app, client, auth_headers, count_queries, expand):
+    # Uno de cada tipo frente a 30: selectinload no consulta un catálogo sin favoritos de ese tipo
+    with app.app_context():
+        few = seed_user('few@test', 3)
+        many = seed_user('many@test', 30)
+
+    counts = {}
+    for user_id, expected in ((few, 3), (many, 30)):
+        path, headers = f'/user/{user_id}/profile?expand={expand}', auth_headers(user_id)
+        # La primera deja el estado del usuario en la caché del token
+        client.get(path, headers=headers)
+        with count_queries() as statements:
+            response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json['user']['favourites']) == expected
+        counts[expected] = len(statements)
+
+    # Versiones para el ETag, usuario, favoritos y una consulta por catálogo
+    assert counts[3] == counts[30] == 6
+
+
+def test_profile_expands_only_what_is_asked(app, client, auth_headers):
+    with app.app_context():
+        user_id = seed_user('fan@test', 3)
+
+    response = client.get(f'/user/{user_id}/profile?expand=planet', headers=auth_headers(user_id))
+    profile = response.json['user']
+    assert profile['email'] == 'fan@test' and 'password' not in profile
+    planet, character, starship = profile['favourites']
+    assert planet['planet']['name'] == planet['planet_name'] == 'fan@test planet 0'
+    assert 'population' in planet['planet']
+    assert character['planet'] is None and 'character' not in character
+    assert character['character_name'] == 'fan@test character 1' and 'starship' not in starship
+
+    expanded = client.get(f'/user/{user_id}/profile?expand=all', headers=auth_headers(user_id)).json['user']
+    assert [sorted(key for key in item if key in Favourites.EXPANDABLE) for item in expanded['favourites']] == \
+        [['character', 'planet', 'starship']] * 3
+    assert client.get(f'/user/{user_id}/profile?expand=moon', headers=auth_headers(user_id)).status_code == 400
+
+
+def test_profile_without_favourites(app, client, auth_headers):
+    with app.app_context():
+        user_id = seed_user('new@test', 0)
+    response = client.get(f'/user/{user_id}/profile?expand=all', headers=auth_headers(user_id))
+    assert response.status_code == 200 and response.json['user']['favourites'] == []
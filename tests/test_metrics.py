@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+import metrics
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    event.listen(engine, 'before_cursor_execute', metrics._before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', metrics._after_cursor_execute)
+    event.listen(engine, 'handle_error', metrics._handle_error)
+    return engine
+
+
+def test_failed_query_leaves_no_timer(app, engine):
+    with app.test_request_context():
+        metrics._start_timer()
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM missing'))
+            assert conn.info['query_start'] == []
+            conn.execute(text('SELECT 1'))
+            assert conn.info['query_start'] == []
+        assert metrics.g.timings['db_count'] == 3
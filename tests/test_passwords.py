@@ -0,0 +1,76 @@
+import threading
+import pytest
+from models import db, User
+import passwords
+from passwords import hash_password, verify_password, HashingBusy
+
+
+def add_user(app, password):
+    with app.app_context():
+        user = User(email='luke@tatooine.org', password=password, is_active=True)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def stored_password(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).password
+
+
+def login(client, password):
+    return client.post('/login', json={'email': 'luke@tatooine.org', 'password': password})
+
+
+def test_hash_and_verify():
+    stored = hash_password('secret')
+    assert stored.startswith(f'scrypt${passwords.SCRYPT_N}$')
+    assert stored != hash_password('secret')
+    assert verify_password(stored, 'secret') == (True, False)
+    assert verify_password(stored, 'wrong') == (False, False)
+    assert verify_password(None, 'secret') == (False, False)
+
+
+def test_cost_change_rehashes_on_login(app, client, monkeypatch):
+    monkeypatch.setattr(passwords, 'SCRYPT_N', 2 ** 10)
+    user_id = add_user(app, hash_password('secret'))
+    monkeypatch.setattr(passwords, 'SCRYPT_N', 2 ** 11)
+    assert verify_password(stored_password(app, user_id), 'secret') == (True, True)
+
+    assert login(client, 'secret').status_code == 200
+    stored = stored_password(app, user_id)
+    assert stored.startswith('scrypt$2048$')
+    assert verify_password(stored, 'secret') == (True, False)
+
+
+def test_plaintext_password_is_upgraded_on_login(app, client):
+    user_id = add_user(app, 'secret')
+    assert login(client, 'wrong').status_code == 401
+    assert stored_password(app, user_id) == 'secret'
+
+    assert login(client, 'secret').status_code == 200
+    stored = stored_password(app, user_id)
+    assert stored.startswith('scrypt$')
+    assert verify_password(stored, 'secret') == (True, False)
+
+
+@pytest.mark.parametrize('stored', ['scrypt$x$8$1$c2FsdA==$a2V5', 'scrypt$16384$8$1$***$a2V5',
+                                    'scrypt$16384$8$1$c2FsdA$a2V5', 'scrypt$3$8$1$c2FsdA==$a2V5'])
+def test_malformed_hash_is_compared_as_plaintext(app, client, stored):
+    # Un valor con forma de hash pero roto no da un 500: se trata como una contraseña antigua
+    assert verify_password(stored, 'secret') == (False, True)
+    add_user(app, stored)
+    assert login(client, 'secret').status_code == 401
+
+
+def test_busy_pool_returns_503(app, client, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(passwords, '_slots', slots)
+    with pytest.raises(HashingBusy):
+        hash_password('secret')
+
+    add_user(app, 'secret')
+    response = login(client, 'secret')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy.exc import SAWarning
+from models import db, User, Planets, Favourites, FavouriteCount
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        db.session.add(User(email='fan@test', password='x', is_active=True))
+        db.session.execute(Planets.__table__.insert(), [{'name': f'planet {i}'} for i in range(50)])
+        db.session.commit()
+        return db.session.execute(db.select(User.id)).scalar()
+
+
+def batch(client, auth_headers, user_id, count_queries, **body):
+    with count_queries() as statements:
+        response = client.post(f'/user/{user_id}/favourites/batch', json=body, headers=auth_headers(user_id))
+    assert response.status_code == 200
+    return statements
+
+
+def planet_refs(ids):
+    return [{'planet_id': planet_id} for planet_id in ids]
+
+
+def test_batch_updates_counters_with_a_fixed_number_of_statements(app, client, auth_headers, count_queries, seeded):
+    small = batch(client, auth_headers, seeded, count_queries, add=planet_refs(range(1, 3)))
+    large = batch(client, auth_headers, seeded, count_queries, add=planet_refs(range(3, 51)))
+    # Las altas de favoritos dependen del tamaño del lote (executemany), los contadores no
+    counter_statements = lambda statements: [sql for sql in statements if 'favourite_counts' in sql]
+    assert len(counter_statements(small)) == len(counter_statements(large)) == 2
+
+    removed = batch(client, auth_headers, seeded, count_queries, remove=planet_refs(range(1, 51)))
+    assert len(counter_statements(removed)) == 2
+
+    with app.app_context():
+        counts = db.session.execute(db.select(FavouriteCount.value)).scalars().all()
+    assert len(counts) == 50 and set(counts) == {0}
+
+
+def test_top_follows_batches(client, auth_headers, count_queries, seeded):
+    assert client.get('/top?type=planets').json['top'] == []
+    batch(client, auth_headers, seeded, count_queries, add=planet_refs([7, 9]))
+    top = client.get('/top?type=planets').json['top']
+    assert [(item['id'], item['favourites']) for item in top] == [(7, 1), (9, 1)]
+    batch(client, auth_headers, seeded, count_queries, remove=planet_refs([7]))
+    assert [item['id'] for item in client.get('/top?type=planets').json['top']] == [9]
+
+
+@pytest.mark.parametrize('query', ['type=planets&limit=abc', 'type=planets&limit=', 'type=planets&limit=1.5',
+                                   'type=planets&limit=0', 'type=planets&limit=100000', 'type=moons'])
+def test_top_rejects_bad_parameters(client, query):
+    assert client.get('/top?' + query).status_code == 400
+
+
+def planet_count(app, planet_id):
+    with app.app_context():
+        return db.session.execute(
+            db.select(FavouriteCount.value).where(FavouriteCount.target_type == 'planets',
+                                                  FavouriteCount.target_id == planet_id)
+        ).scalar()
+
+
+@pytest.mark.parametrize('stale_delete', ['endpoint', 'orm'])
+def test_concurrent_double_delete_counts_once(app, client, auth_headers, count_queries, seeded, stale_delete):
+    from favourites import remove_favourites
+    created = client.post(f'/user/{seeded}/favourites', json={'planet_id': 3}, headers=auth_headers(seeded))
+    favourite_id = created.json['favourite']['id']
+    assert planet_count(app, 3) == 1
+
+    with app.app_context():
+        # Esta sesión carga el favorito y otra petición lo borra antes que ella
+        favourite = db.session.get(Favourites, favourite_id)
+        with app.app_context():
+            response = client.delete(f'/user/{seeded}/favourites/{favourite_id}', headers=auth_headers(seeded))
+        assert response.status_code == 204
+        if stale_delete == 'endpoint':
+            assert remove_favourites([favourite]) == []
+        else:
+            db.session.delete(favourite)
+            with pytest.warns(SAWarning):
+                db.session.flush()
+        db.session.commit()
+
+    assert planet_count(app, 3) == 0
+    assert client.delete(f'/user/{seeded}/favourites/{favourite_id}', headers=auth_headers(seeded)).status_code == 404
+    assert client.get('/top?type=planets').json['top'] == []
@@ -0,0 +1,80 @@
+import pytest
+from flask import Flask, jsonify
+import ratelimit
+from ratelimit import MemoryStore, Policy, evaluate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Reloj fijo que el test mueve a mano: now[0] son los segundos desde el epoch
+    now = [1200.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def limited(monkeypatch, clock):
+    # App mínima con init_rate_limits, 3 peticiones por minuto en 'login' y sin límite en el resto
+    monkeypatch.setattr(ratelimit, 'store', MemoryStore())
+    monkeypatch.setattr(ratelimit, 'policies', {'login': Policy.parse('3/minute')})
+    monkeypatch.setattr(ratelimit, 'DEFAULT_POLICY', None)
+    app = Flask(__name__)
+    app.add_url_rule('/login', 'login', lambda: jsonify({'msg': 'ok'}))
+    app.add_url_rule('/planets', 'show_planets', lambda: jsonify({'msg': 'ok'}))
+    ratelimit.init_rate_limits(app)
+    return app.test_client()
+
+
+def test_policy_parse():
+    assert Policy.parse('10/minute').header() == '10;w=60'
+    assert Policy.parse('5/30s').header() == '5;w=30'
+
+
+def test_evaluate_weights_previous_window():
+    # A mitad de ventana la anterior cuenta la mitad
+    assert evaluate(4, 0, 3, 60, 1230) == (True, 0, 30, 0)
+    assert evaluate(4, 1, 3, 60, 1230) == (False, 0, 30, 15)
+    # Sin ventana anterior hay que esperar a que empiece la siguiente
+    assert evaluate(0, 3, 3, 60, 1230) == (False, 0, 30, 30)
+
+
+def test_limit_returns_429_with_retry_after(limited, clock):
+    for remaining in ('2', '1', '0'):
+        response = limited.get('/login')
+        assert response.status_code == 200
+        assert response.headers['RateLimit-Remaining'] == remaining
+        assert response.headers['RateLimit-Policy'] == '3;w=60'
+        assert 'Retry-After' not in response.headers
+
+    rejected = limited.get('/login')
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After'] == '60'
+    assert rejected.headers['RateLimit-Remaining'] == '0'
+    assert rejected.json['msg']
+
+    # Mitad de la ventana siguiente: las 3 de antes pesan 1.5, cabe una más y luego hay que
+    # esperar a que la anterior pese menos (10 segundos)
+    clock[0] = 1290
+    assert limited.get('/login').status_code == 200
+    rejected = limited.get('/login')
+    assert rejected.status_code == 429 and rejected.headers['Retry-After'] == '10'
+    clock[0] = 1300
+    assert limited.get('/login').status_code == 200
+
+
+def test_limit_is_per_client_and_route(limited):
+    for _ in range(3):
+        limited.get('/login')
+    assert limited.get('/login').status_code == 429
+    assert limited.get('/login', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+    # Las rutas sin política ni RATE_LIMIT_DEFAULT no se limitan ni llevan cabeceras
+    response = limited.get('/planets')
+    assert response.status_code == 200 and 'RateLimit-Limit' not in response.headers
+
+
+def test_token_user_is_the_client(app, limited, auth_headers):
+    for _ in range(3):
+        limited.get('/login', headers=auth_headers(1))
+    assert limited.get('/login', headers=auth_headers(1), environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 429
+    assert limited.get('/login', headers=auth_headers(2)).status_code == 200
+    assert limited.get('/login').status_code == 200
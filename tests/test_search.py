@@ -0,0 +1,32 @@
+from models import db, Characters, Planets
+from search import prefix_index
+
+
+def seed(app):
+    with app.app_context():
+        db.session.add_all([Characters(name='Luke Skywalker'), Characters(name='Anakin Skywalker'),
+                            Planets(name='Tatooine'), Planets(name='Hoth')])
+        db.session.commit()
+        prefix_index.rebuild('characters', Characters)
+        prefix_index.rebuild('planets', Planets)
+
+
+def names(response):
+    assert response.status_code == 200
+    return [result['name'] for result in response.json['results']]
+
+
+def test_search_by_word_prefix_and_typo(app, client):
+    seed(app)
+    assert names(client.get('/search?q=sky')) == ['Anakin Skywalker', 'Luke Skywalker']
+    assert names(client.get('/search?q=tatoine')) == ['Tatooine']
+
+
+def test_index_follows_commits(app, client):
+    seed(app)
+    with app.app_context():
+        planet = db.session.execute(db.select(Planets).filter_by(name='Hoth')).scalar_one()
+        planet.name = 'Hoth Base'
+        db.session.add(Planets(name='Hosnian Prime'))
+        db.session.commit()
+    assert names(client.get('/search?q=ho')) == ['Hosnian Prime', 'Hoth Base']
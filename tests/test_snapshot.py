@@ -0,0 +1,116 @@
+import pytest
+from sqlalchemy import text
+from models import db, User, Favourites, Planets, Characters, FavouriteCount
+from snapshot import snapshot_tables
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        user = User(email='luke@tatooine.org', password='x', is_active=True)
+        planet = Planets(name='Tatooine', population=200000)
+        db.session.add_all([user, Characters(name='Luke'), Favourites(user=user, planet=planet)])
+        db.session.add_all([Planets(name=f'planet {i}') for i in range(20)])
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def cli(app):
+    runner = app.test_cli_runner()
+    return lambda *args: runner.invoke(args=['snapshot', *args])
+
+
+def dump(app):
+    # Contenido de todas las tablas que se copian, ordenado por clave primaria
+    with app.app_context():
+        return {table.name: db.session.execute(db.select(table).order_by(*table.primary_key.columns)).all()
+                for table in snapshot_tables()}
+
+
+def set_revision(app, revision):
+    with app.app_context():
+        db.session.execute(text('CREATE TABLE IF NOT EXISTS alembic_version (version_num VARCHAR(32) NOT NULL)'))
+        db.session.execute(text('DELETE FROM alembic_version'))
+        db.session.execute(text('INSERT INTO alembic_version VALUES (:revision)'), {'revision': revision})
+        db.session.commit()
+
+
+@pytest.mark.parametrize('suffix', ['.ndjson', '.ndjson.gz', '.ndjson.zst'])
+def test_export_import_round_trip(seeded, cli, client, tmp_path, suffix):
+    if suffix.endswith('.zst'):
+        pytest.importorskip('zstandard')
+    path = str(tmp_path / ('data' + suffix))
+    before = dump(seeded)
+    stats = client.get('/stats').json
+
+    exported = cli('export', path)
+    assert exported.exit_code == 0, exported.output
+    assert '24 filas exportadas' in exported.output
+
+    # Sin --replace no se mezcla con lo que ya hay
+    refused = cli('import', path)
+    assert refused.exit_code == 1 and '--replace' in refused.output
+    assert dump(seeded) == before
+
+    imported = cli('import', path, '--replace')
+    assert imported.exit_code == 0, imported.output
+    assert dump(seeded) == before
+    # Los contadores se recalculan al importar
+    assert client.get('/stats').json == stats
+    with seeded.app_context():
+        assert db.session.execute(db.select(FavouriteCount.value)).scalars().all() == [1]
+
+
+def test_import_into_empty_database(seeded, cli, tmp_path):
+    path = str(tmp_path / 'data.ndjson.gz')
+    before = dump(seeded)
+    assert cli('export', path).exit_code == 0
+    with seeded.app_context():
+        db.drop_all()
+        db.create_all()
+
+    imported = cli('import', path)
+    assert imported.exit_code == 0, imported.output
+    assert dump(seeded) == before
+    # Los ids siguen donde los dejó la copia
+    with seeded.app_context():
+        planet = Planets(name='Hoth')
+        db.session.add(planet)
+        db.session.commit()
+        assert planet.id == 22
+
+
+def test_import_changes_user_etags(seeded, cli, client, tmp_path):
+    path = str(tmp_path / 'data.ndjson')
+    etag = client.get('/users').headers['ETag']
+    assert cli('export', path).exit_code == 0
+    assert cli('import', path, '--replace').exit_code == 0
+    # Mismos datos pero otra base de datos (epoch nuevo): ningún cliente puede reutilizar su copia
+    response = client.get('/users', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_revision_mismatch_is_rejected(seeded, cli, tmp_path):
+    path = str(tmp_path / 'data.ndjson')
+    set_revision(seeded, 'aaaaaaaaaaaa')
+    assert cli('export', path).exit_code == 0
+    set_revision(seeded, 'bbbbbbbbbbbb')
+    before = dump(seeded)
+
+    rejected = cli('import', path, '--replace')
+    assert rejected.exit_code == 1
+    assert 'aaaaaaaaaaaa' in rejected.output and 'flask db upgrade' in rejected.output
+    # La transacción se deshace: el --replace no ha vaciado nada
+    assert dump(seeded) == before
+
+    set_revision(seeded, 'aaaaaaaaaaaa')
+    assert cli('import', path, '--replace').exit_code == 0
+
+
+def test_unknown_format_is_rejected(seeded, cli, tmp_path):
+    path = tmp_path / 'data.ndjson'
+    path.write_text('{"table": "user", "columns": []}\n')
+    rejected = cli('import', str(path), '--replace')
+    assert rejected.exit_code == 1 and 'formato' in rejected.output
+    assert cli('import', str(tmp_path / 'missing.ndjson')).exit_code == 1
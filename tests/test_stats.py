@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy.exc import SAWarning
+from models import db, Planets
+
+
+@pytest.fixture
+def planet_id(app, client):
+    planet = {'name': 'Hoth', 'diameter': 7200, 'rotation_period': 23, 'orbital_period': 549,
+              'gravity': '1.1 standard', 'population': 1000, 'climate': 'frozen', 'terrain': 'tundra'}
+    assert client.post('/add_datas?type=planets', json=[planet, dict(planet, name='Endor', population=30)]).status_code == 201
+    with app.app_context():
+        return db.session.execute(db.select(Planets.id).where(Planets.name == 'Hoth')).scalar()
+
+
+def planet_stats(client):
+    return client.get('/stats').json['planets']
+
+
+def test_stats_follow_orm_delete(app, client, planet_id):
+    assert planet_stats(client) == {'count': 2, 'population_total': 1030}
+    with app.app_context():
+        db.session.delete(db.session.get(Planets, planet_id))
+        db.session.commit()
+    assert planet_stats(client) == {'count': 1, 'population_total': 30}
+
+
+def test_concurrent_double_delete_counts_once(app, client, planet_id):
+    with app.app_context():
+        # Esta sesión carga el planeta y otra lo borra antes que ella
+        planet = db.session.get(Planets, planet_id)
+        with app.app_context():
+            db.session.delete(db.session.get(Planets, planet_id))
+            db.session.commit()
+        db.session.delete(planet)
+        with pytest.warns(SAWarning):
+            db.session.flush()
+        db.session.commit()
+    assert planet_stats(client) == {'count': 1, 'population_total': 30}